@@ -0,0 +1,118 @@
+"""Events per second for the shared EventDecoder against the old brace-and-comma splitter.
+
+Usage:
+    python benchmarks/event_decoder_bench.py --events 1e5,1e6 --out event_decoder_bench.json
+
+Decoders:
+    splitter  the parse that MegaUnstructuredPipeline and MiniChaosPipeline used before
+    record    EventDecoder.decode, the C json scanner called on each event
+    batch     EventDecoder.decode_partition, the path the pipelines now run under mapPartitions
+              (the same per-value scan with one ingest time per batch, so expect the record rate)
+
+The corpus carries ISO timestamps and URLs, and the report counts how many events each
+decoder returned with a field missing or different from json.loads.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+
+SHARED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared")
+sys.path.insert(0, SHARED)
+
+from event_decoder import EventDecoder
+
+
+def splitter_parse(json_str):
+    m = {}
+    try:
+        parts = json_str.replace("{", "").replace("}", "").split(",")
+        for p in parts:
+            kv = p.split(":")
+            if len(kv) == 2:
+                m[kv[0].replace("\"", "").strip()] = kv[1].replace("\"", "").strip()
+    except Exception:
+        pass
+    return m
+
+
+def generate_corpus(events, users, bad_rate, seed=7):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(events):
+        if rng.random() < bad_rate:
+            corpus.append('{"user": "u%d", "device": ' % rng.randrange(users))
+            continue
+        corpus.append(json.dumps({
+            "user": f"u{rng.randrange(users)}",
+            "device": f"device{rng.randrange(1000)}",
+            "event_type": rng.choice(["click", "view", "purchase"]),
+            "ts": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:00Z",
+            "url": f"https://shop.example.com:8443/item/{rng.randrange(10000)}",
+            "amount": round(rng.uniform(0, 500), 2)
+        }))
+    return corpus
+
+
+def mismatches(corpus, decoded):
+    count = 0
+    for value, event in zip(corpus, decoded):
+        try:
+            expected = json.loads(value)
+        except ValueError:
+            continue
+        if any(str(event.get(key)) != str(expected[key]) for key in ("user", "device", "ts", "url")):
+            count += 1
+    return count
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark event decoding")
+    parser.add_argument("--events", default="1e5,1e6", help="comma-separated corpus sizes")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--badRate", type=float, default=0.001)
+    parser.add_argument("--batchSize", type=int, default=1024)
+    parser.add_argument("--out", default="event_decoder_bench.json")
+    args = parser.parse_args(argv)
+
+    decoder = EventDecoder(batch_size=args.batchSize)
+    decoders = {
+        "splitter": lambda corpus: [splitter_parse(value) for value in corpus],
+        "record": lambda corpus: [decoder.decode(value) for value in corpus],
+        "batch": lambda corpus: list(decoder.decode_partition(corpus))
+    }
+
+    results = []
+    for events in (int(float(size)) for size in args.events.split(",")):
+        corpus = generate_corpus(events, args.users, args.badRate)
+        for name, decode in decoders.items():
+            # Collection is off while timing, as in timeit, so a pass is not charged for the previous one's garbage
+            gc.collect()
+            gc.disable()
+            started = time.perf_counter()
+            decoded = decode(corpus)
+            seconds = time.perf_counter() - started
+            gc.enable()
+            result = {
+                "events": events,
+                "decoder": name,
+                "seconds": seconds,
+                "events_per_second": events / seconds,
+                "mismatched_events": mismatches(corpus, decoded)
+            }
+            # Freed before the next pass so it does not time allocation against a larger heap
+            decoded = None
+            results.append(result)
+            print(f"{events:>10d} {name:>9s} {result['events_per_second']:>14,.0f} events/s  "
+                  f"{result['mismatched_events']:>9d} mismatched")
+
+    with open(args.out, "w") as f:
+        json.dump({"users": args.users, "bad_rate": args.badRate, "batch_size": args.batchSize, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
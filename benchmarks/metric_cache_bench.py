@@ -0,0 +1,118 @@
+"""Throughput and hit rate of the shared ShardedLRUCache against MiniChaosPipeline's old MetricCache.
+
+Usage:
+    python benchmarks/metric_cache_bench.py --threads 1,4,16 --ops 200000 --out metric_cache_bench.json
+
+Every thread runs the same mix of get and set calls (--readRatio) over Zipf-distributed keys
+(--skew) drawn from --keys distinct users, against a cache of --capacity entries. The old
+cache evicts in insertion order, so it also loses hot keys the new one keeps.
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+SHARED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared")
+sys.path.insert(0, SHARED)
+
+from metric_cache import ShardedLRUCache
+
+
+class MetricCache(OrderedDict):
+    # MiniChaosPipeline.MetricCache as it was, with a capacity argument
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        super().__init__()
+    def __setitem__(self, key, value):
+        with self.lock:
+            super().__setitem__(key, value)
+            if len(self) > self.maxsize:
+                self.popitem(last=False)
+    def get(self, key, default=None):
+        with self.lock:
+            return super().get(key, default)
+
+
+def workload(ops, keys, skew, read_ratio, seed):
+    rng = random.Random(seed)
+    cumulative = list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, keys + 1)))
+    return [
+        (rng.random() < read_ratio, f"u{bisect.bisect_left(cumulative, rng.random() * cumulative[-1])}")
+        for _ in range(ops)
+    ]
+
+
+def run(cache, threads, ops_per_thread):
+    start = threading.Barrier(threads + 1)
+    hits = [0] * threads
+
+    def worker(index):
+        # Reads and writes go through the public methods the pipeline uses
+        get = cache.get
+        local_hits = 0
+        start.wait()
+        for is_read, key in ops_per_thread[index]:
+            if is_read:
+                if get(key) is not None:
+                    local_hits += 1
+                else:
+                    cache[key] = 1.0
+            else:
+                cache[key] = 1.0
+        hits[index] = local_hits
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    ops = sum(len(thread_ops) for thread_ops in ops_per_thread)
+    reads = sum(is_read for thread_ops in ops_per_thread for is_read, _ in thread_ops)
+    return {"seconds": seconds, "ops_per_second": ops / seconds, "hit_rate": sum(hits) / reads if reads else 0.0}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark metric caches under concurrent load")
+    parser.add_argument("--threads", default="1,4,16", help="comma-separated thread counts")
+    parser.add_argument("--ops", type=int, default=200000, help="operations per thread")
+    parser.add_argument("--keys", type=int, default=50000)
+    parser.add_argument("--capacity", type=int, default=5000)
+    parser.add_argument("--shards", type=int, default=16, help="MiniChaosPipeline uses 16")
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--readRatio", type=float, default=0.8)
+    parser.add_argument("--out", default="metric_cache_bench.json")
+    args = parser.parse_args(argv)
+
+    caches = {
+        "MetricCache": lambda: MetricCache(args.capacity),
+        "ShardedLRUCache": lambda: ShardedLRUCache(args.capacity, args.shards)
+    }
+
+    results = []
+    for threads in (int(count) for count in args.threads.split(",")):
+        ops_per_thread = [workload(args.ops, args.keys, args.skew, args.readRatio, seed) for seed in range(threads)]
+        for name, make_cache in caches.items():
+            result = {"threads": threads, "cache": name, **run(make_cache(), threads, ops_per_thread)}
+            results.append(result)
+            print(f"{threads:>4d} threads {name:>16s} {result['ops_per_second']:>14,.0f} ops/s  "
+                  f"hit rate {result['hit_rate']:.3f}")
+
+    with open(args.out, "w") as f:
+        json.dump({"capacity": args.capacity, "shards": args.shards, "keys": args.keys, "skew": args.skew,
+                   "read_ratio": args.readRatio, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
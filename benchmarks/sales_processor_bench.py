@@ -0,0 +1,245 @@
+"""Benchmark every SalesDataProcessor conversion against a reference.
+
+Usage:
+    python benchmarks/sales_processor_bench.py --sizes 1e4,1e5,1e6 --out sales_bench.json
+    python benchmarks/sales_processor_bench.py --sizes 1e8 --dataDir /data/sales_bench
+    python benchmarks/sales_processor_bench.py --baseline sales_bench.json
+
+Each outputN/conv.py defining SalesDataProcessor is loaded, every revenue
+entry point it has is timed on the same synthetic records, and the results
+are checked against the Java semantics (price * quantity, 10% off above 100
+units, summed per region). Results are written as JSON; with --baseline the
+run fails when a variant's throughput drops by more than --tolerance.
+
+Sizes above --maxInMemoryRows (1e7 by default, roughly 1 GB of record strings)
+are written to a CSV file instead and only the streaming file entry points are
+timed on it, since 1e8 records held as strings would need 7+ GB.
+"""
+
+import argparse
+import glob
+import importlib.util
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ["calculate_revenue", "calculateRevenue", "calculate_revenue_columnar"]
+# Take a path and stream it, so they run at sizes that do not fit in memory
+FILE_ENTRY_POINTS = ["calculate_revenue_from_file", "calculate_revenue_parallel"]
+
+REGIONS = ["North", "South", "East", "West", "Central", "NorthEast", "NorthWest", "SouthEast", "SouthWest", "Islands"]
+
+
+def reference_revenue(records):
+    revenue_by_region = {}
+    for record in records:
+        parts = record.split(",")
+        price = float(parts[1])
+        quantity = int(parts[2])
+        total = price * quantity
+        if quantity > 100:
+            total = total * 0.9
+        revenue_by_region[parts[0]] = revenue_by_region.get(parts[0], 0.0) + total
+    return revenue_by_region
+
+
+def iter_records(rows, seed=42):
+    rng = random.Random(seed)
+    for _ in range(rows):
+        yield f"{rng.choice(REGIONS)},{rng.randint(100, 200000) / 100},{rng.randint(1, 200)}"
+
+
+def generate_records(rows, seed=42):
+    return list(iter_records(rows, seed))
+
+
+def write_records(path, rows, seed=42):
+    # Same records as generate_records, streamed to disk; an existing complete file is reused
+    marker = path + ".done"
+    if os.path.exists(marker):
+        return
+    with open(path, "w") as f:
+        for record in iter_records(rows, seed):
+            f.write(record)
+            f.write("\n")
+    open(marker, "w").close()
+
+
+def iter_file_records(path):
+    with open(path) as f:
+        for line in f:
+            yield line.rstrip("\n")
+
+
+def load_variants(entry_points):
+    variants = []
+    for path in sorted(glob.glob(os.path.join(REPO_ROOT, "output*", "conv.py"))):
+        with open(path) as f:
+            if "class SalesDataProcessor" not in f.read():
+                continue
+
+        conversion = os.path.basename(os.path.dirname(path))
+        # Registered in sys.modules so process-pool entry points can pickle their functions
+        module_name = f"sales_bench_{conversion}"
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except ImportError as e:
+            print(f"Skipping {conversion}: {e}", file=sys.stderr)
+            continue
+
+        for entry_point in entry_points:
+            fn = getattr(module.SalesDataProcessor, entry_point, None)
+            if fn is not None:
+                variants.append((f"{conversion}.{entry_point}", fn))
+    return variants
+
+
+def compare(result, expected):
+    if set(result) != set(expected):
+        return False, math.inf
+
+    max_rel_error = 0.0
+    for region, value in expected.items():
+        max_rel_error = max(max_rel_error, abs(result[region] - value) / max(abs(value), 1e-12))
+    return max_rel_error <= 1e-9, max_rel_error
+
+
+def run_variant(fn, records, expected, repeat, rows=None):
+    # records is a list of strings, or a file path for the file entry points
+    rows = len(records) if rows is None else rows
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(records)
+        best = min(best, time.perf_counter() - start)
+
+    # Peak memory is measured on a separate run since tracemalloc slows the timed ones down
+    tracemalloc.start()
+    fn(records)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    correct, max_rel_error = compare(result, expected)
+    return {
+        "seconds": best,
+        "rows_per_second": rows / best if best > 0 else math.inf,
+        "peak_memory_bytes": peak,
+        "correct": correct,
+        "max_rel_error": max_rel_error if math.isfinite(max_rel_error) else None
+    }
+
+
+def check_regressions(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {(r["variant"], r["rows"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    for r in results:
+        previous = baseline.get((r["variant"], r["rows"]))
+        if previous is None:
+            continue
+        if r["rows_per_second"] < previous["rows_per_second"] * (1 - tolerance):
+            regressions.append(f"{r['variant']} @ {r['rows']} rows: "
+                               f"{previous['rows_per_second']:.0f} -> {r['rows_per_second']:.0f} rows/s")
+        if previous["correct"] and not r["correct"]:
+            regressions.append(f"{r['variant']} @ {r['rows']} rows: no longer matches the reference")
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark SalesDataProcessor conversions")
+    parser.add_argument("--sizes", default="1e4,1e5,1e6", help="comma-separated row counts, 1e4 to 1e8")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per variant; the best is kept")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--variants", default="", help="only run variants whose name contains one of these comma-separated strings")
+    parser.add_argument("--maxInMemoryRows", type=float, default=1e7,
+                        help="larger sizes are benchmarked from a file with the streaming entry points")
+    parser.add_argument("--dataDir", help="where to keep generated record files (default: a temporary directory)")
+    parser.add_argument("--out", default="sales_bench_results.json")
+    parser.add_argument("--baseline", help="previous results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed throughput drop against --baseline")
+    args = parser.parse_args(argv)
+
+    sizes = [int(float(size)) for size in args.sizes.split(",")]
+    for size in sizes:
+        if not 1e4 <= size <= 1e8:
+            parser.error(f"size {size} is outside 1e4..1e8")
+
+    def selected(variants):
+        if not args.variants:
+            return variants
+        wanted = args.variants.split(",")
+        return [(name, fn) for name, fn in variants if any(w in name for w in wanted)]
+
+    variants = selected(load_variants(ENTRY_POINTS))
+    file_variants = selected(load_variants(FILE_ENTRY_POINTS))
+
+    temp_dir = None
+    if args.dataDir is None and any(rows > args.maxInMemoryRows for rows in sizes):
+        temp_dir = tempfile.TemporaryDirectory(prefix="sales_bench_")
+    data_dir = args.dataDir or (temp_dir.name if temp_dir else None)
+
+    results = []
+    try:
+        for rows in sizes:
+            if rows <= args.maxInMemoryRows:
+                records = generate_records(rows, args.seed)
+                expected = reference_revenue(records)
+                runs = [(name, fn, records) for name, fn in variants]
+                source = "memory"
+            else:
+                os.makedirs(data_dir, exist_ok=True)
+                records = os.path.join(data_dir, f"sales_{rows}_{args.seed}.csv")
+                write_records(records, rows, args.seed)
+                expected = reference_revenue(iter_file_records(records))
+                runs = [(name, fn, records) for name, fn in file_variants]
+                source = "file"
+
+            for name, fn, data in runs:
+                try:
+                    outcome = run_variant(fn, data, expected, args.repeat, rows)
+                except Exception as e:
+                    outcome = {"seconds": None, "rows_per_second": 0.0, "peak_memory_bytes": None,
+                               "correct": False, "max_rel_error": None, "error": repr(e)}
+                results.append({"variant": name, "rows": rows, "input": source, **outcome})
+                print(f"{name:45s} {rows:>10d} rows  {outcome['rows_per_second']:>12.0f} rows/s  "
+                      f"peak {(outcome['peak_memory_bytes'] or 0) / 2**20:8.1f} MiB  "
+                      f"{'ok' if outcome['correct'] else 'MISMATCH'}")
+
+            del records
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.baseline:
+        regressions = check_regressions(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,113 @@
+"""Rows per second for each UserMetricsJob score-bucketing mode in Spark local mode.
+
+Usage:
+    python benchmarks/score_bucket_bench.py --rows 1e6,1e7 --out score_bucket_bench.json
+
+Modes:
+    native      the bucket table compiled into a CASE WHEN (UserMetricsJob.score_bucket_expr)
+    pandas_udf  the vectorized fallback (UserMetricsJob.score_bucket_pandas_udf)
+    python_udf  a row-at-a-time Python UDF, the shape of the old --useUdf path
+
+Each mode is materialized through the noop sink so only the bucketing is timed,
+and the per-bucket counts of every mode are checked against native.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+OUTPUT6 = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "output6")
+sys.path.insert(0, OUTPUT6)
+# Python workers import conv too when unpickling the UDFs
+os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [OUTPUT6, os.environ.get("PYTHONPATH")]))
+
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import col, lit, udf, when
+from pyspark.sql.types import StringType
+
+from conv import UserMetricsJob
+
+
+def python_udf(score_buckets):
+    ordered = sorted(score_buckets, reverse=True)
+
+    @udf(StringType())
+    def bucket_score(score):
+        if score is None:
+            return "unknown"
+        for bound, label in ordered:
+            if score >= bound:
+                return label
+        return "unknown"
+
+    return bucket_score
+
+
+def scores(spark, rows, null_rate):
+    null_every = max(int(round(1 / null_rate)), 1) if null_rate > 0 else 0
+    score = ((col("id") * 7919) % 101).cast("int")
+    if null_every:
+        score = when(col("id") % null_every == 0, lit(None).cast("int")).otherwise(score)
+    return spark.range(rows).select(score.alias("score"))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark score bucketing modes")
+    parser.add_argument("--rows", default="1e6", help="comma-separated row counts")
+    parser.add_argument("--nullRate", type=float, default=0.05)
+    parser.add_argument("--scoreBuckets", default=None, help='e.g. "80:high,50:medium,0:low"')
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default="score_bucket_bench.json")
+    args = parser.parse_args(argv)
+
+    score_buckets = UserMetricsJob.parse_score_buckets(args.scoreBuckets) or UserMetricsJob.SCORE_BUCKETS
+    modes = {
+        "native": lambda c: UserMetricsJob.score_bucket_expr(c, score_buckets),
+        "pandas_udf": UserMetricsJob.score_bucket_pandas_udf(score_buckets),
+        "python_udf": python_udf(score_buckets)
+    }
+
+    spark = SparkSession.builder \
+        .appName("ScoreBucketBench") \
+        .master("local[*]") \
+        .config("spark.sql.shuffle.partitions", "8") \
+        .getOrCreate()
+
+    results = []
+    try:
+        for rows in [int(float(r)) for r in args.rows.split(",")]:
+            df = scores(spark, rows, args.nullRate).cache()
+            df.count()
+
+            expected = None
+            for mode, bucket in modes.items():
+                bucketed = df.select(bucket(col("score")).alias("score_bucket"))
+
+                best = float("inf")
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    bucketed.write.format("noop").mode("overwrite").save()
+                    best = min(best, time.perf_counter() - started)
+
+                counts = {r["score_bucket"]: r["count"] for r in bucketed.groupBy("score_bucket").count().collect()}
+                if expected is None:
+                    expected = counts
+
+                result = {"mode": mode, "rows": rows, "seconds": best, "rows_per_second": rows / best,
+                          "matches_native": counts == expected}
+                results.append(result)
+                print(f"{mode:12s} {rows:>12d} rows {result['rows_per_second']:>14.0f} rows/s  "
+                      f"{'ok' if result['matches_native'] else 'MISMATCH'}")
+
+            df.unpersist()
+    finally:
+        spark.stop()
+
+    with open(args.out, "w") as f:
+        json.dump({"score_buckets": score_buckets, "null_rate": args.nullRate, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,139 @@
+"""Shuffle size and time of MegaUnstructuredPipeline's per-user aggregation on skewed events.
+
+Usage:
+    python benchmarks/user_aggregation_bench.py --events 1e6,1e7 --users 10000 --skew 1.2 \
+        --out user_aggregation_bench.json
+
+Strategies:
+    groupByKey      every event shuffled, then folded per user (the old MegaUnstructuredPipeline.main)
+    aggregateByKey  map-side (sum, count, maxTs) per user, then merged (MegaUnstructuredPipeline.addEvent
+                    and mergeAggregates)
+
+Users follow a Zipf law with exponent --skew. Shuffle bytes are read from the Spark status API,
+and both strategies' results are checked to agree per user.
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import math
+import os
+import random
+import sys
+
+OUTPUT15 = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "output15")
+SHARED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared")
+sys.path.insert(0, OUTPUT15)
+# Python workers import conv and event_decoder when unpickling the aggregation functions
+os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [OUTPUT15, SHARED, os.environ.get("PYTHONPATH")]))
+
+from pyspark.sql import SparkSession
+
+from conv import MegaUnstructuredPipeline
+from user_metrics_bench import timed
+
+
+def legacy_aggregate(tuple_):
+    sum_ = 0.0
+    count = 0
+    maxTs = 0
+    for m in tuple_[1]:
+        try:
+            val = float(m.get("random_metric", "0"))
+        except Exception:
+            val = 0.0
+        sum_ += val
+        count += 1
+        try:
+            ts = int(m.get("processed_ts", "0"))
+        except Exception:
+            ts = 0
+        if ts > maxTs:
+            maxTs = ts
+    return (tuple_[0], (sum_, count, maxTs))
+
+
+def skewed_events(sc, events, users, skew, partitions, seed=7):
+    cumulative = sc.broadcast(list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, users + 1))))
+
+    def generate(index, rows):
+        rng = random.Random(seed + index)
+        weights = cumulative.value
+        for _ in rows:
+            user = bisect.bisect_left(weights, rng.random() * weights[-1])
+            event = {
+                "user": f"u{user}",
+                "device": f"device{rng.randrange(1000)}",
+                "device_type": "MOBILE",
+                "processed_ts": 1700000000000 + rng.randrange(86400000),
+                "random_metric": rng.random() * 1000
+            }
+            yield (event["user"], event)
+
+    return sc.range(events, numSlices=partitions).mapPartitionsWithIndex(generate)
+
+
+def agree(left, right):
+    if left.keys() != right.keys():
+        return False
+    for user, (sum_, count, max_ts) in left.items():
+        other = right[user]
+        if count != other[1] or max_ts != other[2] or not math.isclose(sum_, other[0], rel_tol=1e-9):
+            return False
+    return True
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark per-user aggregation strategies")
+    parser.add_argument("--events", default="1e6", help="comma-separated event counts")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--skew", type=float, default=1.2, help="Zipf exponent of user popularity")
+    parser.add_argument("--partitions", type=int, default=8)
+    parser.add_argument("--master", default="local[*]")
+    parser.add_argument("--out", default="user_aggregation_bench.json")
+    args = parser.parse_args(argv)
+
+    spark = SparkSession.builder \
+        .appName("UserAggregationBench") \
+        .master(args.master) \
+        .config("spark.sql.shuffle.partitions", str(args.partitions)) \
+        .getOrCreate()
+    sc = spark.sparkContext
+
+    strategies = {
+        "groupByKey": lambda keyed: keyed.groupByKey(args.partitions).map(legacy_aggregate),
+        "aggregateByKey": lambda keyed: keyed.aggregateByKey(
+            (0.0, 0, 0), MegaUnstructuredPipeline.addEvent, MegaUnstructuredPipeline.mergeAggregates, args.partitions)
+    }
+
+    results = []
+    try:
+        for events in (int(float(size)) for size in args.events.split(",")):
+            keyed = skewed_events(sc, events, args.users, args.skew, args.partitions)
+            outputs = {}
+            for name, aggregate in strategies.items():
+                collected = {}
+                metrics = timed(spark, f"{name}:{events}", lambda: collected.update(aggregate(keyed).collect()))
+                outputs[name] = collected
+                result = {
+                    "events": events,
+                    "strategy": name,
+                    "seconds": metrics["seconds"],
+                    "shuffle_write_bytes": metrics["shuffle_write_bytes"],
+                    "shuffle_read_bytes": metrics["shuffle_read_bytes"]
+                }
+                results.append(result)
+                print(f"{events:>12d} {name:>15s} {result['seconds']:8.2f}s  "
+                      f"shuffle {result['shuffle_write_bytes'] / 2**20:10.2f} MiB")
+            if not agree(outputs["groupByKey"], outputs["aggregateByKey"]):
+                raise SystemExit(f"aggregateByKey disagrees with groupByKey at {events} events")
+    finally:
+        spark.stop()
+
+    with open(args.out, "w") as f:
+        json.dump({"users": args.users, "skew": args.skew, "partitions": args.partitions, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
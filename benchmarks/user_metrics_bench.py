@@ -0,0 +1,232 @@
+"""Synthetic data generator and Spark local-mode benchmark for UserMetricsJob.
+
+Usage:
+    python benchmarks/user_metrics_bench.py --scales 1e5,1e6 --users 10000 --skew 1.1 --nullRate 0.02 \
+        --shufflePartitions 8 --out user_metrics_bench.json
+    python benchmarks/user_metrics_bench.py --generateOnly --scales 1e6 --dataDir /tmp/um_data
+
+For every scale it writes events.csv and users.csv (user popularity follows a
+Zipf law with exponent --skew; --nullRate of scores, amounts and countries
+are empty), then runs load_events -> transform -> write_output and records
+per-stage durations and shuffle bytes from the Spark status API, plus the
+output size on disk.
+"""
+
+import argparse
+import bisect
+import csv
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+OUTPUT6 = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "output6")
+
+EVENT_TYPES = ["click", "purchase", "view", "signup"]
+EVENT_TYPE_WEIGHTS = [0.5, 0.1, 0.35, 0.05]
+COUNTRIES = ["US", "IN", "DE", "BR", "JP", "GB", "FR", "CA"]
+
+
+def generate(data_dir, events, users, skew=1.0, null_rate=0.0, days=365, seed=7):
+    rng = random.Random(seed)
+    os.makedirs(data_dir, exist_ok=True)
+
+    with open(os.path.join(data_dir, "users.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["user_id", "country"])
+        for user in range(users):
+            writer.writerow([f"u{user}", "" if rng.random() < null_rate else rng.choice(COUNTRIES)])
+
+    # Zipf weights over user rank; skew 0 is uniform
+    cumulative = list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, users + 1)))
+    event_cumulative = list(itertools.accumulate(EVENT_TYPE_WEIGHTS))
+    start = datetime(2024, 1, 1)
+    span_seconds = days * 86400
+
+    with open(os.path.join(data_dir, "events.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["user_id", "event_type", "score", "amount", "ts"])
+        for _ in range(events):
+            user = bisect.bisect_left(cumulative, rng.random() * cumulative[-1])
+            event_type = EVENT_TYPES[bisect.bisect_left(event_cumulative, rng.random() * event_cumulative[-1])]
+            score = "" if rng.random() < null_rate else rng.randint(0, 100)
+            amount = "" if rng.random() < null_rate else round(rng.uniform(0, 500), 2)
+            ts = start + timedelta(seconds=rng.randrange(span_seconds))
+            writer.writerow([f"u{user}", event_type, score, amount, ts.strftime("%Y-%m-%d %H:%M:%S")])
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def fetch_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+
+def stage_metrics(spark, job_group, timeout_seconds=60):
+    # Stages of the jobs in job_group, from the driver's REST status API. Spark's listener bus
+    # updates the status store after the action has returned, so this first waits for the bus to
+    # drain and then polls until every job in the group has SUCCEEDED and the latest attempt of
+    # each of its stages is COMPLETE or SKIPPED; summing earlier would miss the last stages.
+    base = f"{spark.sparkContext.uiWebUrl}/api/v1/applications/{spark.sparkContext.applicationId}"
+    deadline = time.monotonic() + timeout_seconds
+    try:
+        spark.sparkContext._jsc.sc().listenerBus().waitUntilEmpty(int(timeout_seconds * 1000))
+        drained = True
+    except Exception:
+        # Polling alone still waits for the status to settle
+        drained = False
+
+    while True:
+        jobs = [job for job in fetch_json(f"{base}/jobs") if job.get("jobGroup") == job_group]
+        failed = [job["jobId"] for job in jobs if job["status"] == "FAILED"]
+        if failed:
+            raise RuntimeError(f"Jobs {failed} in job group {job_group} failed")
+        attempts = {stage_id: fetch_json(f"{base}/stages/{stage_id}")
+                    for stage_id in sorted({stage_id for job in jobs for stage_id in job["stageIds"]})}
+        settled = (jobs or drained) and all(job["status"] == "SUCCEEDED" for job in jobs) and all(
+            max(stage_attempts, key=lambda attempt: attempt["attemptId"])["status"] in ("COMPLETE", "SKIPPED")
+            for stage_attempts in attempts.values())
+        if settled:
+            break
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Spark status for job group {job_group} did not settle in {timeout_seconds}s")
+        time.sleep(0.1)
+
+    stages = []
+    for stage_id, stage_attempts in attempts.items():
+        for attempt in stage_attempts:
+            if attempt.get("status") != "COMPLETE":
+                continue
+            submitted = datetime.strptime(attempt["submissionTime"], "%Y-%m-%dT%H:%M:%S.%f%Z")
+            completed = datetime.strptime(attempt["completionTime"], "%Y-%m-%dT%H:%M:%S.%f%Z")
+            stages.append({
+                "stage_id": stage_id,
+                "name": attempt["name"],
+                "seconds": (completed - submitted).total_seconds(),
+                "tasks": attempt["numCompleteTasks"],
+                "input_bytes": attempt["inputBytes"],
+                "shuffle_read_bytes": attempt["shuffleReadBytes"],
+                "shuffle_write_bytes": attempt["shuffleWriteBytes"],
+                "output_bytes": attempt["outputBytes"]
+            })
+    return stages
+
+
+def timed(spark, label, action):
+    spark.sparkContext.setJobGroup(label, label)
+    started = time.perf_counter()
+    action()
+    seconds = time.perf_counter() - started
+    stages = stage_metrics(spark, label)
+    return {
+        "seconds": seconds,
+        "shuffle_read_bytes": sum(s["shuffle_read_bytes"] for s in stages),
+        "shuffle_write_bytes": sum(s["shuffle_write_bytes"] for s in stages),
+        "stages": stages
+    }
+
+
+def run_scale(spark, UserMetricsJob, data_dir, out_path, args):
+    events_path = os.path.join(data_dir, "events.csv")
+    users_path = os.path.join(data_dir, "users.csv")
+
+    events = UserMetricsJob.load_events(spark, events_path)
+    users = UserMetricsJob.load_users(spark, users_path)
+
+    load = timed(spark, f"load:{data_dir}", lambda: (events.count(), users.count()))
+
+    def transform_and_write():
+        transformed = UserMetricsJob.transform(
+            events, users, args.fromDate, args.toDate, args.useUdf,
+            users_size_bytes=os.path.getsize(users_path))
+        UserMetricsJob.write_output(transformed, out_path, "overwrite")
+
+    shutil.rmtree(out_path, ignore_errors=True)
+    write = timed(spark, f"write:{data_dir}", transform_and_write)
+
+    return {"load": load, "transform_write": write, "output_bytes": directory_size(out_path)}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark UserMetricsJob in Spark local mode")
+    parser.add_argument("--scales", default="1e5,1e6", help="comma-separated event row counts")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of user popularity; 0 is uniform")
+    parser.add_argument("--nullRate", type=float, default=0.02)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--dataDir", default="bench_data/user_metrics")
+    parser.add_argument("--generateOnly", action="store_true")
+    parser.add_argument("--regenerate", action="store_true", help="rewrite data that already exists")
+    parser.add_argument("--fromDate", default="1970-01-01")
+    parser.add_argument("--toDate", default="2100-01-01")
+    parser.add_argument("--useUdf", action="store_true")
+    parser.add_argument("--master", default="local[*]")
+    parser.add_argument("--shufflePartitions", type=int, help="shorthand for --conf spark.sql.shuffle.partitions=N")
+    parser.add_argument("--conf", action="append", default=[], help="Spark setting as key=value; repeatable")
+    parser.add_argument("--out", default="user_metrics_bench.json")
+    args = parser.parse_args(argv)
+
+    scales = [int(float(scale)) for scale in args.scales.split(",")]
+    data_dirs = {}
+    for scale in scales:
+        data_dir = os.path.join(args.dataDir, f"events_{scale}")
+        if args.regenerate or not os.path.exists(os.path.join(data_dir, "events.csv")):
+            started = time.perf_counter()
+            generate(data_dir, scale, args.users, args.skew, args.nullRate, args.days, args.seed)
+            print(f"generated {scale} events in {time.perf_counter() - started:.1f}s -> {data_dir}")
+        data_dirs[scale] = data_dir
+    if args.generateOnly:
+        return
+
+    sys.path.insert(0, OUTPUT6)
+    # Python workers import conv when unpickling UDFs
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [OUTPUT6, os.environ.get("PYTHONPATH")]))
+    from pyspark.sql import SparkSession
+    from conv import UserMetricsJob
+
+    builder = SparkSession.builder \
+        .appName("UserMetricsBench") \
+        .master(args.master) \
+        .config("spark.sql.adaptive.enabled", "true")
+    conf = dict(setting.split("=", 1) for setting in args.conf)
+    if args.shufflePartitions is not None:
+        conf["spark.sql.shuffle.partitions"] = str(args.shufflePartitions)
+    for key, value in conf.items():
+        builder = builder.config(key, value)
+    spark = builder.getOrCreate()
+
+    results = []
+    try:
+        for scale in scales:
+            out_path = os.path.join(data_dirs[scale], "out")
+            result = {"events": scale, **run_scale(spark, UserMetricsJob, data_dirs[scale], out_path, args)}
+            results.append(result)
+            print(f"{scale:>12d} events  load {result['load']['seconds']:8.2f}s  "
+                  f"transform+write {result['transform_write']['seconds']:8.2f}s  "
+                  f"shuffle {result['transform_write']['shuffle_write_bytes'] / 2**20:8.1f} MiB  "
+                  f"output {result['output_bytes'] / 2**20:8.1f} MiB")
+    finally:
+        spark.stop()
+
+    report = {
+        "users": args.users,
+        "skew": args.skew,
+        "null_rate": args.nullRate,
+        "master": args.master,
+        "conf": conf,
+        "results": results
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
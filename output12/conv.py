@@ -1,8 +1,22 @@
+import csv
+import io
+import json
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
 class SalesDataProcessor:
 
     @staticmethod
-    def calculate_revenue(records):
-        revenue_by_region = {}
+    def calculate_revenue(records, revenue_by_region=None):
+        if revenue_by_region is None:
+            revenue_by_region = {}
 
         for record in records:
             parts = record.split(',')
@@ -24,15 +38,260 @@ class SalesDataProcessor:
         return revenue_by_region
 
     @staticmethod
-    def filter_high_revenue_regions(revenue_map):
+    def read_record_chunks(path, chunk_size=1 << 20, start_offset=0, end_offset=None):
+        # Yields (byte offset after the chunk, records); chunks are cut on line boundaries.
+        # Reading stops at end_offset, which must itself fall on a line boundary.
+        with open(path, "rb") as f:
+            f.seek(start_offset)
+            offset = start_offset
+            position = start_offset
+            pending = b""
+
+            while True:
+                size = chunk_size if end_offset is None else min(chunk_size, end_offset - position)
+                block = f.read(size) if size > 0 else b""
+                if not block:
+                    break
+
+                position += len(block)
+
+                block = pending + block
+                cut = block.rfind(b"\n") + 1
+                pending = block[cut:]
+                if cut == 0:
+                    continue
+
+                offset += cut
+                yield offset, [line for line in block[:cut].decode("utf-8").splitlines() if line]
+
+            if pending:
+                offset += len(pending)
+                yield offset, [line for line in pending.decode("utf-8").splitlines() if line]
+
+    @staticmethod
+    def iter_revenue_from_file(path, chunk_size=1 << 20, start_offset=0, end_offset=None, revenue_by_region=None):
+        # Folds each chunk into the running totals and yields (offset, totals) so a run can be checkpointed.
+        # The totals yielded are a copy, so a stored checkpoint stays as of its offset; to resume,
+        # pass the last checkpointed offset and totals back in.
+        if revenue_by_region is None:
+            revenue_by_region = {}
+
+        for offset, records in SalesDataProcessor.read_record_chunks(path, chunk_size, start_offset, end_offset):
+            SalesDataProcessor.calculate_revenue(records, revenue_by_region)
+            yield offset, dict(revenue_by_region)
+
+    @staticmethod
+    def calculate_revenue_from_file(path, chunk_size=1 << 20, start_offset=0, end_offset=None, revenue_by_region=None):
+        if revenue_by_region is None:
+            revenue_by_region = {}
+
+        for _ in SalesDataProcessor.iter_revenue_from_file(path, chunk_size, start_offset, end_offset, revenue_by_region):
+            pass
+
+        return revenue_by_region
+
+    @staticmethod
+    def split_file(path, range_size=16 << 20):
+        # Cuts the file into (start, end) byte ranges of about range_size, each ending on a line boundary
+        size = os.path.getsize(path)
+        boundaries = [0]
+
+        with open(path, "rb") as f:
+            for target in range(range_size, size, range_size):
+                if target - 1 < boundaries[-1]:
+                    continue
+                f.seek(target - 1)
+                f.readline()
+                boundaries.append(f.tell())
+
+        if boundaries[-1] < size:
+            boundaries.append(size)
+        return list(zip(boundaries, boundaries[1:]))
+
+    @staticmethod
+    def revenue_for_range(path, start_offset, end_offset):
+        return SalesDataProcessor.calculate_revenue_from_file(path, start_offset=start_offset, end_offset=end_offset)
+
+    @staticmethod
+    def merge_revenue(partials):
+        merged = {}
+
+        for partial in partials:
+            for region, total in partial.items():
+                if region not in merged:
+                    merged[region] = total
+                else:
+                    merged[region] += total
+
+        return merged
+
+    @staticmethod
+    def calculate_revenue_parallel(path, workers=None, range_size=16 << 20):
+        # Ranges depend only on the file and range_size, and partials are merged in range order,
+        # so the totals are bit-for-bit the same across runs whatever the number of workers
+        ranges = SalesDataProcessor.split_file(path, range_size)
+        if not ranges:
+            return {}
+
+        starts = [start for start, _ in ranges]
+        ends = [end for _, end in ranges]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            partials = executor.map(SalesDataProcessor.revenue_for_range, repeat(path), starts, ends)
+            return SalesDataProcessor.merge_revenue(partials)
+
+    @staticmethod
+    def parse_columns(records):
+        # Returns (region names, region codes, prices, quantities); names are in order of first appearance
+        return SalesDataProcessor.read_columns(io.StringIO("\n".join(records)))
+
+    @staticmethod
+    def read_columns(source):
+        # One pass of the pandas C parser over a path or text buffer. Fields are split on commas
+        # with no quoting or NA handling, as record.split(',') does, and only the first three are read.
+        # Prices are parsed with round_trip precision, so they are the same doubles float() gives.
+        try:
+            columns = pd.read_csv(
+                source,
+                header=None,
+                usecols=[0, 1, 2],
+                dtype={0: object, 1: np.float64, 2: np.int64},
+                quoting=csv.QUOTE_NONE,
+                na_filter=False,
+                float_precision="round_trip"
+            )
+        except pd.errors.EmptyDataError:
+            # Nothing but blank lines, which the row path skips too
+            return [], np.zeros(0, dtype=np.intp), np.zeros(0), np.zeros(0, dtype=np.int64)
+        codes, regions = pd.factorize(columns[0], sort=False)
+        return regions.tolist(), codes, columns[1].to_numpy(), columns[2].to_numpy()
+
+    @staticmethod
+    def calculate_revenue_columnar(records):
+        # Same result as calculate_revenue, with the discount and per-region sums done on whole arrays
+        if not records:
+            return {}
+
+        return SalesDataProcessor.revenue_from_columns(*SalesDataProcessor.parse_columns(records))
+
+    @staticmethod
+    def calculate_revenue_columnar_from_file(path):
+        # Columnar path straight from the file, without building a Python string per record
+        return SalesDataProcessor.revenue_from_columns(*SalesDataProcessor.read_columns(path))
+
+    @staticmethod
+    def revenue_from_columns(regions, codes, prices, quantities):
+        totals = prices * quantities
+        totals = np.where(quantities > 100, totals * 0.9, totals)
+
+        sums = np.bincount(codes, weights=totals, minlength=len(regions))
+        return dict(zip(regions, sums.tolist()))
+
+    @staticmethod
+    def filter_high_revenue_regions(revenue_map, threshold=50000):
         result = []
 
         for region, revenue in revenue_map.items():
-            if revenue > 50000:
+            if revenue > threshold:
                 result.append(region)
 
         return result
 
+class RevenueIndex:
+    # Sorted view of a calculate_revenue result, built once and queried by bisection
+
+    def __init__(self, revenue_map):
+        ranked = sorted(revenue_map.items(), key=lambda item: item[1])
+        self.regions = [region for region, _ in ranked]
+        self.revenues = [revenue for _, revenue in ranked]
+
+    def regions_above(self, threshold=50000):
+        # Regions with revenue > threshold, lowest revenue first
+        return self.regions[bisect_right(self.revenues, threshold):]
+
+    def top_k(self, k):
+        # The k highest-revenue regions, highest first
+        if k <= 0:
+            return []
+        return self.regions[:-k - 1:-1]
+
+    def regions_in_range(self, low, high):
+        # Regions with low <= revenue <= high, lowest revenue first
+        return self.regions[bisect_left(self.revenues, low):bisect_right(self.revenues, high)]
+
+class IncrementalRevenueAggregator:
+    # Keeps per-region totals between micro-batches, so each refresh costs O(new records).
+    # Record counts are tracked so a region whose records are all retracted is dropped
+    # instead of lingering with a float residue.
+
+    def __init__(self):
+        self.revenue_by_region = {}
+        self.record_counts = {}
+
+    @staticmethod
+    def parse(records):
+        parsed = []
+
+        for record in records:
+            parts = record.split(',')
+            price = float(parts[1])
+            quantity = int(parts[2])
+
+            total = price * quantity
+
+            if quantity > 100:
+                total = total * 0.9
+
+            parsed.append((parts[0], total))
+
+        return parsed
+
+    def apply(self, records):
+        # The batch is parsed up front so a malformed record leaves the totals untouched
+        for region, total in self.parse(records):
+            if region not in self.revenue_by_region:
+                self.revenue_by_region[region] = total
+                self.record_counts[region] = 1
+            else:
+                self.revenue_by_region[region] += total
+                self.record_counts[region] += 1
+
+    def retract(self, records):
+        parsed = self.parse(records)
+
+        for region, count in Counter(region for region, _ in parsed).items():
+            if self.record_counts.get(region, 0) < count:
+                raise ValueError(f"Cannot retract {count} records from region {region}: only {self.record_counts.get(region, 0)} applied")
+
+        for region, total in parsed:
+            self.record_counts[region] -= 1
+            if self.record_counts[region] == 0:
+                del self.record_counts[region]
+                del self.revenue_by_region[region]
+            else:
+                self.revenue_by_region[region] -= total
+
+    def totals(self):
+        return dict(self.revenue_by_region)
+
+    def snapshot(self, path):
+        # Written to a temporary file first so a crash never leaves a half-written snapshot
+        state = {"revenue_by_region": self.revenue_by_region, "record_counts": self.record_counts}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def restore(cls, path):
+        with open(path) as f:
+            state = json.load(f)
+
+        aggregator = cls()
+        aggregator.revenue_by_region = state["revenue_by_region"]
+        aggregator.record_counts = state["record_counts"]
+        return aggregator
+
 if __name__ == "__main__":
     data = [
         "North,1000,50",
@@ -41,6 +300,9 @@ if __name__ == "__main__":
         "North,1200,150"
     ]
 
-    revenue = SalesDataProcessor.calculate_revenue(data)
+    if len(sys.argv) > 1:
+        revenue = SalesDataProcessor.calculate_revenue_from_file(sys.argv[1])
+    else:
+        revenue = SalesDataProcessor.calculate_revenue(data)
     high_revenue_regions = SalesDataProcessor.filter_high_revenue_regions(revenue)
     print(high_revenue_regions)
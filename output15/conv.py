@@ -1,19 +1,30 @@
+import os
+import sys
 import threading
-from concurrent.futures import ThreadPoolExecutor
 import time
 from datetime import datetime
-import psycopg2
 
 from pyspark.sql import SparkSession, Row
 from pyspark.sql.types import StructType, StructField, StringType, DoubleType, LongType, MetadataBuilder
 
+SHARED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared")
+sys.path.insert(0, SHARED_DIR)
+
+from event_decoder import EventDecoder
+from pg_sink import BoundedWriteQueue, PgSink, get_pool, postgres_connector
+
 # Note: The Java code uses a concurrent map and thread pool executor.
-# In Python, we use a thread-safe dictionary and ThreadPoolExecutor.
+# In Python, we use a thread-safe dictionary and a bounded write queue.
 # The Spark code is mapped to PySpark equivalents.
 
 class MegaUnstructuredPipeline:
     dimCache = {}
-    executor = ThreadPoolExecutor(max_workers=8)
+    decoder = EventDecoder(ingest_time_field="ingest_time")
+    dbConfig = {"host": "localhost", "port": 5432, "database": "test", "user": "user", "password": "pass"}
+    dbPoolSize = 8
+    dbBatchSize = 500
+    dbWriters = 8
+    dbMaxPendingBatches = 16
 
     @staticmethod
     def main(args):
@@ -22,6 +33,8 @@ class MegaUnstructuredPipeline:
             .master("local[*]") \
             .config("spark.sql.shuffle.partitions", "8") \
             .getOrCreate()
+        spark.sparkContext.addPyFile(os.path.join(SHARED_DIR, "event_decoder.py"))
+        spark.sparkContext.addPyFile(os.path.join(SHARED_DIR, "pg_sink.py"))
 
         MegaUnstructuredPipeline.loadDimension()
 
@@ -34,7 +47,7 @@ class MegaUnstructuredPipeline:
 
         raw = kafka.selectExpr("CAST(value AS STRING)").rdd.map(lambda row: row[0])
 
-        parsed = raw.map(lambda x: MegaUnstructuredPipeline.parse(x))
+        parsed = raw.mapPartitions(MegaUnstructuredPipeline.decoder.decode_partition)
 
         # In PySpark, broadcast variables are created with sparkContext.broadcast
         bc = spark.sparkContext.broadcast(MegaUnstructuredPipeline.dimCache)
@@ -51,28 +64,11 @@ class MegaUnstructuredPipeline:
 
         keyed = enriched.map(lambda x: (str(x.get("user", "NA")), x))
 
-        grouped = keyed.groupByKey()
-
-        def aggregate(tuple_):
-            sum_ = 0.0
-            count = 0
-            maxTs = 0
-            for m in tuple_[1]:
-                try:
-                    val = float(m.get("random_metric", "0"))
-                except Exception:
-                    val = 0.0
-                sum_ += val
-                count += 1
-                try:
-                    ts = int(m.get("processed_ts", "0"))
-                except Exception:
-                    ts = 0
-                if ts > maxTs:
-                    maxTs = ts
-            return Row(tuple_[0], sum_, count, maxTs)
-
-        aggregated = grouped.map(aggregate)
+        # Each partition folds its events into one (sum, count, maxTs) per user before the
+        # shuffle, so only those triples cross the network however heavy a user is
+        aggregated = keyed \
+            .aggregateByKey((0.0, 0, 0), MegaUnstructuredPipeline.addEvent, MegaUnstructuredPipeline.mergeAggregates) \
+            .map(lambda kv: Row(kv[0], kv[1][0], kv[1][1], kv[1][2]))
 
         schema = StructType([
             StructField("user", StringType(), False, MetadataBuilder().build()),
@@ -86,73 +82,68 @@ class MegaUnstructuredPipeline:
         finalDf.cache()
 
         def process_partition(iterator):
-            batch = []
-            for row in iterator:
-                batch.append(row)
-                if len(batch) >= 500:
-                    MegaUnstructuredPipeline.writeBatch(batch)
-                    batch.clear()
-            if batch:
-                MegaUnstructuredPipeline.writeBatch(batch)
-
-        finalDf.foreachPartition(process_partition)
+            # The partition completes only after every batch is written, and a failed write fails the task
+            with BoundedWriteQueue(MegaUnstructuredPipeline.aggSink().write, MegaUnstructuredPipeline.dbWriters,
+                                   MegaUnstructuredPipeline.dbMaxPendingBatches) as writer:
+                batch = []
+                for row in iterator:
+                    batch.append(row)
+                    if len(batch) >= MegaUnstructuredPipeline.dbBatchSize:
+                        MegaUnstructuredPipeline.writeBatch(writer, batch)
+                        batch = []
+                if batch:
+                    MegaUnstructuredPipeline.writeBatch(writer, batch)
+            yield writer.metrics()
+
+        writeMetrics = finalDf.rdd.mapPartitions(process_partition).collect()
+        MegaUnstructuredPipeline.reportWriteMetrics(writeMetrics)
 
         spark.stop()
-        MegaUnstructuredPipeline.executor.shutdown()
 
     @staticmethod
     def parse(json_str):
-        map_ = {}
+        return MegaUnstructuredPipeline.decoder.decode_batch([json_str])[0]
+
+    @staticmethod
+    def addEvent(acc, m):
+        sum_, count, maxTs = acc
+        try:
+            val = float(m.get("random_metric", "0"))
+        except Exception:
+            val = 0.0
         try:
-            cleaned = json_str.replace("{", "").replace("}", "")
-            parts = cleaned.split(",")
-            for p in parts:
-                kv = p.split(":")
-                if len(kv) == 2:
-                    map_[kv[0].replace("\"", "").strip()] = kv[1].replace("\"", "").strip()
-            map_["ingest_time"] = int(time.time() * 1000)
+            ts = int(m.get("processed_ts", "0"))
         except Exception:
-            map_["error"] = "bad_record"
-        return map_
+            ts = 0
+        return (sum_ + val, count + 1, ts if ts > maxTs else maxTs)
+
+    @staticmethod
+    def mergeAggregates(a, b):
+        return (a[0] + b[0], a[1] + b[1], a[2] if a[2] >= b[2] else b[2])
+
+    @staticmethod
+    def aggSink():
+        # The pool is per executor process, so batches reuse its connections across tasks
+        pool = get_pool("agg_table", postgres_connector(**MegaUnstructuredPipeline.dbConfig), MegaUnstructuredPipeline.dbPoolSize)
+        return PgSink(pool, "agg_table", ("user_id", "metric_sum", "metric_count", "latest_ts"),
+                      batch_size=MegaUnstructuredPipeline.dbBatchSize)
+
+    @staticmethod
+    def writeBatch(writer, rows):
+        # Blocks while the writer's queue is full
+        writer.submit([tuple(r) for r in rows])
 
     @staticmethod
-    def writeBatch(rows):
-        def db_task():
-            conn = None
-            cur = None
-            try:
-                conn = psycopg2.connect(
-                    host="localhost",
-                    port=5432,
-                    database="test",
-                    user="user",
-                    password="pass"
-                )
-                conn.autocommit = False
-                cur = conn.cursor()
-                sql = "insert into agg_table(user_id,metric_sum,metric_count,latest_ts) values(%s,%s,%s,%s)"
-                for r in rows:
-                    cur.execute(sql, (r[0], r[1], r[2], r[3]))
-                conn.commit()
-            except Exception:
-                if conn is not None:
-                    try:
-                        conn.rollback()
-                    except Exception:
-                        pass
-            finally:
-                if cur is not None:
-                    try:
-                        cur.close()
-                    except Exception:
-                        pass
-                if conn is not None:
-                    try:
-                        conn.close()
-                    except Exception:
-                        pass
-
-        MegaUnstructuredPipeline.executor.submit(db_task)
+    def reportWriteMetrics(partitionMetrics):
+        batches = sum(m["batches_written"] for m in partitionMetrics)
+        rows = sum(m["rows_written"] for m in partitionMetrics)
+        maxDepth = max((m["max_queue_depth"] for m in partitionMetrics), default=0)
+        meanWrite = sum(m["mean_write_seconds"] * m["batches_written"] for m in partitionMetrics) / batches if batches else 0.0
+        meanWait = sum(m["mean_queue_wait_seconds"] * m["batches_written"] for m in partitionMetrics) / batches if batches else 0.0
+        maxWrite = max((m["max_write_seconds"] for m in partitionMetrics), default=0.0)
+        print(f"agg_table: {rows} rows in {batches} batches over {len(partitionMetrics)} partitions, "
+              f"max queue depth {maxDepth}, mean queue wait {meanWait * 1000:.1f} ms, "
+              f"write latency mean {meanWrite * 1000:.1f} ms / max {maxWrite * 1000:.1f} ms")
 
     @staticmethod
     def loadDimension():
@@ -6,36 +6,35 @@ from pyspark.sql import DataFrame
 from pyspark.sql import functions as F
 from pyspark.sql import types as T
 
-import threading
+import os
+import sys
 import time
 import random
-import psycopg2
 
-from collections import OrderedDict
+SHARED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared")
+sys.path.insert(0, SHARED_DIR)
+
+from event_decoder import EventDecoder
+from metric_cache import ShardedLRUCache
+from pg_sink import PgSink, get_pool, postgres_connector
 
 class MiniChaosPipeline:
     # Equivalent to Java's static fields
     dimCache = dict()
-    # Synchronized LRU cache with max size 5000
-    class MetricCache(OrderedDict):
-        def __init__(self, *args, **kwargs):
-            self.maxsize = 5000
-            self.lock = threading.Lock()
-            super().__init__(*args, **kwargs)
-        def __setitem__(self, key, value):
-            with self.lock:
-                super().__setitem__(key, value)
-                if len(self) > self.maxsize:
-                    self.popitem(last=False)
-        def get(self, key, default=None):
-            with self.lock:
-                return super().get(key, default)
-    metricCache = MetricCache()
+    decoder = EventDecoder()
+    dbConfig = {"host": "localhost", "port": 5432, "database": "test", "user": "user", "password": "pass"}
+    dbPoolSize = 2
+    dbBatchSize = 5000
+    # Access-ordered LRU cache with max size 5000, split into 16 independently locked shards
+    metricCache = ShardedLRUCache(capacity=5000, shards=16)
 
     @staticmethod
     def main(args):
         conf = SparkConf().setAppName("MiniChaosPipeline").setMaster("local[*]")
         spark = SparkSession.builder.config(conf=conf).getOrCreate()
+        spark.sparkContext.addPyFile(os.path.join(SHARED_DIR, "event_decoder.py"))
+        spark.sparkContext.addPyFile(os.path.join(SHARED_DIR, "pg_sink.py"))
+        spark.sparkContext.addPyFile(os.path.join(SHARED_DIR, "metric_cache.py"))
 
         MiniChaosPipeline.loadDim()
 
@@ -48,7 +47,7 @@ class MiniChaosPipeline:
 
         raw = kafka.selectExpr("CAST(value AS STRING)").rdd.map(lambda row: row[0])
 
-        parsed = raw.map(lambda x: MiniChaosPipeline.parse(x))
+        parsed = raw.mapPartitions(MiniChaosPipeline.decoder.decode_partition)
 
         sc = spark.sparkContext
         bc = sc.broadcast(MiniChaosPipeline.dimCache)
@@ -97,44 +96,10 @@ class MiniChaosPipeline:
         df.cache()
 
         def foreach_partition(partition):
-            conn = None
-            ps = None
-            try:
-                conn = psycopg2.connect(
-                    host="localhost",
-                    port=5432,
-                    database="test",
-                    user="user",
-                    password="pass"
-                )
-                ps = conn.cursor()
-                batch = []
-                for r in partition:
-                    batch.append((
-                        r["user_id"],
-                        r["metric_sum"],
-                        r["count"],
-                        r["processed_ts"]
-                    ))
-                if batch:
-                    ps.executemany(
-                        "insert into agg_table(user_id,metric_sum,count,processed_ts) values(%s,%s,%s,%s)",
-                        batch
-                    )
-                    conn.commit()
-            except Exception:
-                pass
-            finally:
-                try:
-                    if ps is not None:
-                        ps.close()
-                except Exception:
-                    pass
-                try:
-                    if conn is not None:
-                        conn.close()
-                except Exception:
-                    pass
+            MiniChaosPipeline.aggSink().write(
+                (r["user_id"], r["metric_sum"], r["count"], r["processed_ts"])
+                for r in partition
+            )
 
         df.rdd.foreachPartition(foreach_partition)
 
@@ -142,18 +107,13 @@ class MiniChaosPipeline:
 
     @staticmethod
     def parse(json_str):
-        m = dict()
-        try:
-            parts = json_str.replace("{", "").replace("}", "").split(",")
-            for p in parts:
-                kv = p.split(":")
-                if len(kv) == 2:
-                    k = kv[0].replace("\"", "").strip()
-                    v = kv[1].replace("\"", "").strip()
-                    m[k] = v
-        except Exception:
-            pass
-        return m
+        return MiniChaosPipeline.decoder.decode(json_str)
+
+    @staticmethod
+    def aggSink():
+        pool = get_pool("agg_table", postgres_connector(**MiniChaosPipeline.dbConfig), MiniChaosPipeline.dbPoolSize)
+        return PgSink(pool, "agg_table", ("user_id", "metric_sum", "count", "processed_ts"),
+                      batch_size=MiniChaosPipeline.dbBatchSize)
 
     @staticmethod
     def loadDim():
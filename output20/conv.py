@@ -1,6 +1,14 @@
+import csv
+import gzip
+import os
+import tempfile
+from collections import Counter
 from datetime import date, datetime
 
 class Transaction:
+    # Slotted: no per-instance __dict__, which dominates memory at tens of millions of records
+    __slots__ = ("_transactionId", "_customerId", "_amount", "_currency", "_transactionDate", "_region")
+
     def __init__(self, transactionId, customerId, amount, currency, transactionDate, region):
         self._transactionId = transactionId
         self._customerId = customerId
@@ -27,7 +35,15 @@ class Transaction:
     def getRegion(self):
         return self._region
 
+    def setAmount(self, amount):
+        self._amount = amount
+
+    def setCurrency(self, currency):
+        self._currency = currency
+
 class RawRecord:
+    __slots__ = ("rawLine",)
+
     def __init__(self, rawLine):
         self.rawLine = rawLine
 
@@ -67,6 +83,12 @@ class TransactionTransformer:
             tx.getRegion()
         )
 
+    def normalizeCurrencyInPlace(self, tx):
+        # Same conversion as normalizeCurrency without allocating a second Transaction
+        tx.setAmount(tx.getAmount() * self.FX_RATES.get(tx.getCurrency(), 1.0))
+        tx.setCurrency("USD")
+        return tx
+
 class MetricsAggregator:
     def totalAmountByRegion(self, transactions):
         totals = {}
@@ -76,14 +98,63 @@ class MetricsAggregator:
         return totals
 
 class ErrorSink:
-    def __init__(self):
-        self.badRecords = []
-
-    def recordError(self, rawRecord, reason):
-        self.badRecords.append(rawRecord + " | ERROR: " + reason)
+    # Bad records are kept as (line, reason, offset) tuples and spilled in batches to a gzipped
+    # CSV once flushThreshold is reached; only per-reason counts and a small sample stay in memory.
+    def __init__(self, spillPath=None, flushThreshold=10000, sampleSize=100):
+        self.spillPath = spillPath
+        # Set when flush had to create a temporary spill file, which close then deletes
+        self.ownsSpillPath = False
+        self.flushThreshold = flushThreshold
+        self.sampleSize = sampleSize
+        self.buffer = []
+        self.sample = []
+        self.reasonCounts = Counter()
+        self.errorCount = 0
+
+    def recordError(self, rawRecord, reason, offset=None):
+        error = (rawRecord, reason, offset)
+        self.buffer.append(error)
+        self.reasonCounts[reason] += 1
+        self.errorCount += 1
+        if len(self.sample) < self.sampleSize:
+            self.sample.append(error)
+        if len(self.buffer) >= self.flushThreshold:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.spillPath is None:
+            fd, self.spillPath = tempfile.mkstemp(prefix="bad_records_", suffix=".csv.gz")
+            os.close(fd)
+            self.ownsSpillPath = True
+        # Each flush appends a new gzip member; readers see one continuous stream
+        with gzip.open(self.spillPath, "at", newline="", compresslevel=1) as f:
+            csv.writer(f).writerows(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        # A caller-supplied spill file is completed and kept. A temporary one is scratch space
+        # and is removed along with the buffered records; pass spillPath to keep the bad records.
+        if self.spillPath is not None and not self.ownsSpillPath:
+            self.flush()
+            return
+        if self.spillPath is not None and os.path.exists(self.spillPath):
+            os.remove(self.spillPath)
+        self.spillPath = None
+        self.ownsSpillPath = False
+        self.buffer = []
+
+    def iterErrors(self):
+        if self.spillPath is not None and os.path.exists(self.spillPath):
+            with gzip.open(self.spillPath, "rt", newline="") as f:
+                for rawRecord, reason, offset in csv.reader(f):
+                    yield rawRecord, reason, int(offset) if offset else None
+        yield from self.buffer
 
     def getBadRecords(self):
-        return self.badRecords
+        # Reads every spilled record back; prefer reasonCounts, sample or iterErrors on large feeds
+        return [rawRecord + " | ERROR: " + reason for rawRecord, reason, _ in self.iterErrors()]
 
 class OutputSink:
     def writeMetrics(self, metrics):
@@ -99,21 +170,24 @@ class DataPipeline:
         self.errorSink = ErrorSink()
         self.outputSink = OutputSink()
 
+    def close(self):
+        self.errorSink.close()
+
     def run(self, rawRecords):
         validTransactions = []
 
-        for record in rawRecords:
+        for offset, record in enumerate(rawRecords):
             try:
                 tx = self.parse(record.rawLine)
 
                 if self.validator.isValid(tx):
-                    normalized = self.transformer.normalizeCurrency(tx)
+                    normalized = self.transformer.normalizeCurrencyInPlace(tx)
                     validTransactions.append(normalized)
                 else:
-                    self.errorSink.recordError(record.rawLine, "Validation failed")
+                    self.errorSink.recordError(record.rawLine, "Validation failed", offset)
 
             except Exception as e:
-                self.errorSink.recordError(record.rawLine, str(e))
+                self.errorSink.recordError(record.rawLine, str(e), offset)
 
         metrics = self.aggregator.totalAmountByRegion(validTransactions)
         self.outputSink.writeMetrics(metrics)
@@ -139,3 +213,4 @@ if __name__ == "__main__":
 
     pipeline = DataPipeline()
     pipeline.run(input)
+    pipeline.close()
@@ -1,13 +1,70 @@
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import queue
+import shutil
+import sqlite3
+import tempfile
+import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date, datetime
+from functools import lru_cache, partial
+from itertools import count, islice
+from operator import attrgetter, methodcaller
+
+import numpy as np
+import pandas as pd
+
+ISO_DATE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# Column types for DataPipeline.parse_columns: strings kept as written, amounts left for float(),
+# and the low-cardinality currency, date and region columns read as categoricals
+CHUNK_DTYPES = {0: object, 1: object, 2: object, 3: "category", 4: "category", 5: "category"}
+
+
+@lru_cache(maxsize=4096)
+def parse_iso_date(value):
+    # Feeds carry a few hundred distinct dates, so parsed dates are memoized. Well-formed
+    # YYYY-MM-DD strings skip strptime; anything else, including out-of-range fields, goes
+    # through strptime so errors keep its exact messages.
+    if ISO_DATE.fullmatch(value):
+        try:
+            return date(int(value[:4]), int(value[5:7]), int(value[8:]))
+        except ValueError:
+            pass
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def date_cache_stats():
+    info = parse_iso_date.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+        "size": info.currsize
+    }
 
 class Transaction:
-    def __init__(self, transaction_id, customer_id, amount, currency, transaction_date, region):
+    # Slotted: no per-instance __dict__, which dominates memory at tens of millions of records
+    __slots__ = ("transaction_id", "customer_id", "amount", "currency", "transaction_date", "region", "source_currency")
+
+    def __init__(self, transaction_id, customer_id, amount, currency, transaction_date, region, source_currency=None):
         self.transaction_id = transaction_id
         self.customer_id = customer_id
         self.amount = amount
         self.currency = currency
         self.transaction_date = transaction_date
         self.region = region
+        # The currency the record arrived in; normalization only changes currency
+        self.source_currency = currency if source_currency is None else source_currency
 
     def get_transaction_id(self):
         return self.transaction_id
@@ -27,14 +84,59 @@ class Transaction:
     def get_region(self):
         return self.region
 
+    def get_source_currency(self):
+        return self.source_currency
+
+    def set_amount(self, amount):
+        self.amount = amount
+
+    def set_currency(self, currency):
+        self.currency = currency
+
 
 class RawRecord:
+    __slots__ = ("raw_line",)
+
     def __init__(self, raw_line):
         self.raw_line = raw_line
 
 
+class TransactionBatch:
+    # Struct-of-arrays form of a chunk of parsed transactions; rows are the line indices within the chunk
+    __slots__ = ("rows", "transaction_ids", "customer_ids", "amounts", "currencies", "transaction_dates", "regions")
+
+    def __init__(self, rows, transaction_ids, customer_ids, amounts, currencies, transaction_dates, regions):
+        self.rows = rows
+        self.transaction_ids = transaction_ids
+        self.customer_ids = customer_ids
+        self.amounts = amounts
+        self.currencies = currencies
+        self.transaction_dates = transaction_dates
+        self.regions = regions
+
+    def columns(self):
+        return (self.rows, self.transaction_ids, self.customer_ids, self.amounts,
+                self.currencies, self.transaction_dates, self.regions)
+
+    @staticmethod
+    def from_transactions(rows, transactions):
+        return TransactionBatch(
+            np.array(rows, dtype=np.intp),
+            np.array([tx.get_transaction_id() for tx in transactions], dtype=object),
+            np.array([tx.get_customer_id() for tx in transactions], dtype=object),
+            np.array([tx.get_amount() for tx in transactions], dtype=np.float64),
+            np.array([tx.get_currency() for tx in transactions], dtype=object),
+            np.array([tx.get_transaction_date() for tx in transactions], dtype="datetime64[D]"),
+            np.array([tx.get_region() for tx in transactions], dtype=object)
+        )
+
+
 class TransactionValidator:
-    def is_valid(self, tx):
+    def is_valid(self, tx, today=None):
+        # Callers validating many records pass today in rather than paying for date.today() per record
+        if today is None:
+            today = date.today()
+
         if tx.get_transaction_id() is None or tx.get_transaction_id() == "":
             return False
 
@@ -44,11 +146,107 @@ class TransactionValidator:
         if tx.get_amount() <= 0:
             return False
 
-        if tx.get_transaction_date() > date.today():
+        if tx.get_transaction_date() > today:
             return False
 
         return True
 
+    def valid_mask(self, batch, today):
+        # Same rules as is_valid, evaluated over a whole batch; today is a datetime64[D]
+        return (
+            (batch.transaction_ids != "")
+            & (batch.customer_ids != "")
+            & ~(batch.amounts <= 0)
+            & ~(batch.transaction_dates > today)
+        )
+
+
+class FxRateTable:
+    # Date-versioned FX rates loaded from a CSV with a currency,effective_date,rate header.
+    # A rate applies from its effective date until the next one for the same currency.
+    # Lookups bisect a per-currency index behind an LRU cache keyed on (currency, date);
+    # reload_if_changed swaps in a new index and cache when the file is replaced. A replacement
+    # that fails to load, such as a half-written file, leaves the current table in use; the
+    # error is kept in load_error and passed to on_error (printed to stderr by default) once per
+    # file version.
+    def __init__(self, path, cache_size=4096, on_error=None):
+        self.path = path
+        self.cache_size = cache_size
+        self.on_error = on_error
+        self.lock = threading.Lock()
+        self.version = None
+        self.failed_version = None
+        self.load_error = None
+        self.lookup = None
+        self.load()
+
+    def load(self):
+        # Raises if the file cannot be read or parsed, leaving any current table in place
+        versions = {}
+        with open(self.path, newline="") as f:
+            # Taken from the open file, so the version always describes the rates read
+            stat = os.fstat(f.fileno())
+            for row in csv.DictReader(f):
+                versions.setdefault(row["currency"], []).append((parse_iso_date(row["effective_date"]), float(row["rate"])))
+        if not versions:
+            # An empty or truncated file would otherwise replace every rate
+            raise ValueError(f"No FX rates in {self.path}")
+
+        index = {}
+        for currency, rates in versions.items():
+            rates.sort()
+            index[currency] = ([effective_date for effective_date, _ in rates], [rate for _, rate in rates])
+
+        # A single assignment, so concurrent lookups see either the old table or the new one
+        self.lookup = lru_cache(maxsize=self.cache_size)(partial(FxRateTable.find_rate, index))
+        self.version = (stat.st_mtime_ns, stat.st_size)
+        self.failed_version = None
+        self.load_error = None
+
+    def reload_if_changed(self):
+        # Returns True when a new table was swapped in
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            # A file can be briefly missing while it is replaced; reported once until it returns
+            self.report_error(None, e)
+            return False
+        version = (stat.st_mtime_ns, stat.st_size)
+        if version == self.version or version == self.failed_version:
+            return False
+        with self.lock:
+            if version == self.version or version == self.failed_version:
+                return False
+            try:
+                self.load()
+            except Exception as e:
+                self.report_error(version, e)
+                return False
+        return True
+
+    def report_error(self, version, error):
+        if self.load_error is not None and version == self.failed_version:
+            return
+        self.failed_version = version
+        self.load_error = error
+        if self.on_error is not None:
+            self.on_error(error)
+        else:
+            print(f"Keeping FX rates from {self.path} loaded earlier: {error}", file=sys.stderr)
+
+    def rate(self, currency, transaction_date):
+        return self.lookup(currency, transaction_date)
+
+    @staticmethod
+    def find_rate(index, currency, transaction_date):
+        if currency not in index:
+            raise ValueError(f"No FX rate for currency {currency}")
+        effective_dates, rates = index[currency]
+        position = bisect_right(effective_dates, transaction_date) - 1
+        if position < 0:
+            raise ValueError(f"No FX rate for {currency} on {transaction_date}")
+        return rates[position]
+
 
 class TransactionTransformer:
     FX_RATES = {
@@ -57,8 +255,21 @@ class TransactionTransformer:
         "EUR": 1.1
     }
 
+    def __init__(self, rate_table=None):
+        # Without a rate table the fixed FX_RATES apply, with 1.0 for unknown currencies
+        self.rate_table = rate_table
+
+    def refresh_rates(self):
+        if self.rate_table is not None:
+            self.rate_table.reload_if_changed()
+
+    def rate_for(self, tx):
+        if self.rate_table is None:
+            return self.FX_RATES.get(tx.get_currency(), 1.0)
+        return self.rate_table.rate(tx.get_currency(), tx.get_transaction_date())
+
     def normalize_currency(self, tx):
-        rate = self.FX_RATES.get(tx.get_currency(), 1.0)
+        rate = self.rate_for(tx)
         normalized_amount = tx.get_amount() * rate
         return Transaction(
             tx.get_transaction_id(),
@@ -66,9 +277,39 @@ class TransactionTransformer:
             normalized_amount,
             "USD",
             tx.get_transaction_date(),
-            tx.get_region()
+            tx.get_region(),
+            tx.get_source_currency()
         )
 
+    def normalize_currency_in_place(self, tx):
+        # Same conversion as normalize_currency without allocating a second Transaction
+        tx.set_amount(tx.get_amount() * self.rate_for(tx))
+        tx.set_currency("USD")
+        return tx
+
+    def normalize_currency_columns(self, currencies, amounts, transaction_dates):
+        # One rate lookup per distinct currency (per distinct (currency, date) with a rate table)
+        # instead of one per transaction. Returns the USD amounts and {position: reason} for
+        # transactions whose rate lookup failed; their amounts are NaN.
+        if self.rate_table is None:
+            keys = currencies
+            lookup = lambda currency: self.FX_RATES.get(currency, 1.0)
+        else:
+            keys = list(zip(currencies, transaction_dates))
+            lookup = lambda key: self.rate_table.rate(*key)
+
+        rates, reasons = {}, {}
+        for key in set(keys):
+            try:
+                rates[key] = lookup(key)
+            except Exception as e:
+                rates[key] = np.nan
+                reasons[key] = str(e)
+
+        normalized = amounts * np.fromiter(map(rates.__getitem__, keys), dtype=np.float64, count=len(keys))
+        failed = {position: reasons[key] for position, key in enumerate(keys) if key in reasons} if reasons else {}
+        return normalized, failed
+
 
 class MetricsAggregator:
     def total_amount_by_region(self, transactions):
@@ -78,16 +319,275 @@ class MetricsAggregator:
             totals[region] = totals.get(region, 0.0) + tx.get_amount()
         return totals
 
+    def total_amount_by_region_columns(self, regions, amounts, totals=None):
+        # Folds a column of regions and USD amounts into totals; regions keep first-appearance order
+        if totals is None:
+            totals = {}
+
+        codes = dict.fromkeys(regions)
+        for code, region in enumerate(codes):
+            codes[region] = code
+
+        region_codes = np.fromiter(map(codes.__getitem__, regions), dtype=np.intp, count=len(regions))
+        sums = np.bincount(region_codes, weights=amounts, minlength=len(codes))
+
+        for region, amount in zip(codes, sums.tolist()):
+            totals[region] = totals.get(region, 0.0) + amount
+        return totals
+
+
+class MultiDimensionalAggregator:
+    # Sum, count, min, max and mean of amounts for several group-by keys in one pass. Only the
+    # base groupings are accumulated per transaction, each key holding a [sum, count, min, max]
+    # list; any grouping whose keys are a subset of a base grouping is rolled up from the smallest
+    # table that covers it, including earlier rollups, instead of rescanning transactions.
+    # Amounts are the normalized USD amounts; "currency" is the currency each transaction
+    # arrived in, since after normalization every transaction is in USD.
+    KEY_GETTERS = {
+        "region": methodcaller("get_region"),
+        "day": methodcaller("get_transaction_date"),
+        "customer": methodcaller("get_customer_id"),
+        "currency": methodcaller("get_source_currency")
+    }
+
+    def __init__(self, base_groupings=(("region", "day", "currency"), ("customer",))):
+        self.base_groupings = tuple(tuple(grouping) for grouping in base_groupings)
+        self.tables = {}
+        self.key_getters = []
+        for grouping in base_groupings:
+            grouping = tuple(grouping)
+            getters = [self.KEY_GETTERS[dimension] for dimension in grouping]
+            self.tables[grouping] = {}
+            self.key_getters.append((self.tables[grouping], getters))
+        self.rollups = {}
+
+    @staticmethod
+    def accumulate(table, key, amount):
+        accumulator = table.get(key)
+        if accumulator is None:
+            table[key] = [amount, 1, amount, amount]
+        else:
+            accumulator[0] += amount
+            accumulator[1] += 1
+            if amount < accumulator[2]:
+                accumulator[2] = amount
+            if amount > accumulator[3]:
+                accumulator[3] = amount
+
+    def add(self, tx):
+        # Rollups computed so far are stale once a transaction is added
+        if self.rollups:
+            self.rollups = {}
+        amount = tx.get_amount()
+        for table, getters in self.key_getters:
+            self.accumulate(table, tuple(getter(tx) for getter in getters), amount)
+
+    def add_all(self, transactions):
+        for tx in transactions:
+            self.add(tx)
+
+    def add_columns(self, amounts, columns):
+        # Columnar counterpart of add_all; columns maps each dimension to a list aligned with amounts
+        if self.rollups:
+            self.rollups = {}
+        amounts = amounts.tolist()
+        for grouping, table in self.tables.items():
+            for key, amount in zip(zip(*(columns[dimension] for dimension in grouping)), amounts):
+                self.accumulate(table, key, amount)
+
+    def merge_tables(self, tables):
+        # Folds in the base tables of another aggregator with the same base groupings
+        if self.rollups:
+            self.rollups = {}
+        for grouping, other in tables.items():
+            table = self.tables[grouping]
+            for key, (total, count, low, high) in other.items():
+                accumulator = table.get(key)
+                if accumulator is None:
+                    table[key] = [total, count, low, high]
+                else:
+                    accumulator[0] += total
+                    accumulator[1] += count
+                    if low < accumulator[2]:
+                        accumulator[2] = low
+                    if high > accumulator[3]:
+                        accumulator[3] = high
+
+    def rollup(self, grouping):
+        grouping = tuple(grouping)
+        if grouping in self.tables:
+            return self.tables[grouping]
+        if grouping in self.rollups:
+            return self.rollups[grouping]
+
+        sources = [(source, table) for source, table in list(self.tables.items()) + list(self.rollups.items())
+                   if set(grouping) <= set(source)]
+        if not sources:
+            raise ValueError(f"Grouping {grouping} is not covered by any base grouping")
+        source, table = min(sources, key=lambda item: len(item[1]))
+        positions = [source.index(dimension) for dimension in grouping]
+
+        rolled = {}
+        for key, (total, count, low, high) in table.items():
+            coarse_key = tuple(key[position] for position in positions)
+            accumulator = rolled.get(coarse_key)
+            if accumulator is None:
+                rolled[coarse_key] = [total, count, low, high]
+            else:
+                accumulator[0] += total
+                accumulator[1] += count
+                if low < accumulator[2]:
+                    accumulator[2] = low
+                if high > accumulator[3]:
+                    accumulator[3] = high
+
+        self.rollups[grouping] = rolled
+        return rolled
+
+    def metrics(self, grouping):
+        return {
+            key: {"sum": total, "count": count, "min": low, "max": high, "mean": total / count}
+            for key, (total, count, low, high) in self.rollup(grouping).items()
+        }
+
 
 class ErrorSink:
-    def __init__(self):
-        self.bad_records = []
+    # Bad records are kept as (line, reason, offset) tuples and spilled in batches to a gzipped
+    # CSV once flush_threshold is reached; only per-reason counts and a small sample stay in memory.
+    def __init__(self, spill_path=None, flush_threshold=10000, sample_size=100):
+        self.spill_path = spill_path
+        # Set when flush had to create a temporary spill file, which close then deletes
+        self.owns_spill_path = False
+        self.flush_threshold = flush_threshold
+        self.sample_size = sample_size
+        self.buffer = []
+        self.sample = []
+        self.reason_counts = Counter()
+        self.error_count = 0
+
+    def record_error(self, raw_record, reason, offset=None):
+        error = (raw_record, reason, offset)
+        self.buffer.append(error)
+        self.reason_counts[reason] += 1
+        self.error_count += 1
+        if len(self.sample) < self.sample_size:
+            self.sample.append(error)
+        if len(self.buffer) >= self.flush_threshold:
+            self.flush()
+
+    def ensure_spill_path(self):
+        if self.spill_path is None:
+            fd, self.spill_path = tempfile.mkstemp(prefix="bad_records_", suffix=".csv.gz")
+            os.close(fd)
+            self.owns_spill_path = True
+
+    def flush(self):
+        if not self.buffer:
+            return
+        self.ensure_spill_path()
+        # Each flush appends a new gzip member; readers see one continuous stream
+        with gzip.open(self.spill_path, "at", newline="", compresslevel=1) as f:
+            csv.writer(f).writerows(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        # A caller-supplied spill file is completed and kept. A temporary one is scratch space
+        # and is removed along with the buffered records; pass spill_path to keep the bad records.
+        if self.spill_path is not None and not self.owns_spill_path:
+            self.flush()
+            return
+        if self.spill_path is not None and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.spill_path = None
+        self.owns_spill_path = False
+        self.buffer = []
+
+    def merge_spill(self, spill_path, reason_counts, sample):
+        # Appends a closed sink's spill file (which may not exist if it spilled nothing) and its
+        # counts; those records follow everything recorded here so far
+        self.flush()
+        if spill_path is not None:
+            self.ensure_spill_path()
+            # Concatenated gzip members form a valid gzip file
+            with open(self.spill_path, "ab") as merged, open(spill_path, "rb") as f:
+                shutil.copyfileobj(f, merged)
+        self.reason_counts.update(reason_counts)
+        self.error_count += sum(reason_counts.values())
+        self.sample.extend(sample[:self.sample_size - len(self.sample)])
 
-    def record_error(self, raw_record, reason):
-        self.bad_records.append(f"{raw_record} | ERROR: {reason}")
+    def iter_errors(self):
+        if self.spill_path is not None and os.path.exists(self.spill_path):
+            with gzip.open(self.spill_path, "rt", newline="") as f:
+                for raw_record, reason, offset in csv.reader(f):
+                    yield raw_record, reason, int(offset) if offset else None
+        yield from self.buffer
 
     def get_bad_records(self):
-        return self.bad_records
+        # Reads every spilled record back; prefer reason_counts, sample or iter_errors on large feeds
+        return [f"{raw_record} | ERROR: {reason}" for raw_record, reason, _ in self.iter_errors()]
+
+
+class PipelineInstrumentation:
+    # Per-stage wall time, record counts and error counts for DataPipeline.run, run_batch and
+    # run_parallel, accumulated across runs. run_batch times whole chunks; run_parallel adds up
+    # the stages of every worker, so its stage seconds can exceed the run's wall time.
+    # on_report, if given, is called with summary() after every run.
+    STAGES = ("parse", "validate", "normalize", "aggregate", "output")
+
+    def __init__(self, on_report=None):
+        self.on_report = on_report
+        self.reset()
+
+    def reset(self):
+        self.seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.records = dict.fromkeys(self.STAGES, 0)
+        self.errors = dict.fromkeys(self.STAGES, 0)
+        self.runs = 0
+        self.input_records = 0
+        self.run_seconds = 0.0
+
+    def add(self, stage, seconds, records=0, errors=0):
+        self.seconds[stage] += seconds
+        self.records[stage] += records
+        self.errors[stage] += errors
+
+    def merge(self, other):
+        for stage in self.STAGES:
+            self.add(stage, other.seconds[stage], other.records[stage], other.errors[stage])
+
+    def finish_run(self, input_records, seconds):
+        self.runs += 1
+        self.input_records += input_records
+        self.run_seconds += seconds
+        if self.on_report is not None:
+            self.on_report(self.summary())
+
+    def summary(self):
+        stages = {}
+        for stage in self.STAGES:
+            seconds = self.seconds[stage]
+            stages[stage] = {
+                "seconds": seconds,
+                "records": self.records[stage],
+                "errors": self.errors[stage],
+                "records_per_second": self.records[stage] / seconds if seconds > 0 else 0.0
+            }
+        return {
+            "runs": self.runs,
+            "input_records": self.input_records,
+            "seconds": self.run_seconds,
+            "records_per_second": self.input_records / self.run_seconds if self.run_seconds > 0 else 0.0,
+            "stages": stages
+        }
+
+    def report(self, out=sys.stdout):
+        summary = self.summary()
+        print("=== Pipeline Stages ===", file=out)
+        for stage, stats in summary["stages"].items():
+            print(f"{stage:10s} {stats['seconds']:10.4f}s {stats['records']:>10d} records "
+                  f"{stats['errors']:>8d} errors {stats['records_per_second']:>14.0f} records/s", file=out)
+        print(f"{'total':10s} {summary['seconds']:10.4f}s {summary['input_records']:>10d} records "
+              f"{'':>15s} {summary['records_per_second']:>14.0f} records/s", file=out)
 
 
 class OutputSink:
@@ -96,30 +596,452 @@ class OutputSink:
         for region, total in metrics.items():
             print(f"Region: {region}, Total Amount (USD): {total}")
 
+    def close(self):
+        pass
+
+
+class ConsoleMetricsWriter:
+    def write_rows(self, batch, rows):
+        print("=== Aggregated Metrics ===")
+        for region, total in rows:
+            print(f"Region: {region}, Total Amount (USD): {total}")
+
+    def close(self):
+        pass
+
+
+class CsvMetricsWriter:
+    def __init__(self, path):
+        self.file = open(path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        if self.file.tell() == 0:
+            self.writer.writerow(["batch", "region", "total_usd"])
+
+    def write_rows(self, batch, rows):
+        self.writer.writerows((batch, region, total) for region, total in rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesMetricsWriter:
+    def __init__(self, path):
+        self.file = open(path, "a")
+
+    def write_rows(self, batch, rows):
+        self.file.writelines(json.dumps({"batch": batch, "region": region, "total_usd": total}) + "\n" for region, total in rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class SqliteMetricsWriter:
+    # Stand-in for a real metrics database. The connection is opened lazily so that it belongs
+    # to the thread that writes through it.
+    def __init__(self, path, table="region_metrics"):
+        self.path = path
+        self.table = table
+        self.connection = None
+
+    def write_rows(self, batch, rows):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (batch INTEGER, region TEXT, total_usd REAL)")
+        with self.connection:
+            self.connection.executemany(f"INSERT INTO {self.table} VALUES (?, ?, ?)", ((batch, region, total) for region, total in rows))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+class AsyncOutputSink:
+    # Drop-in for OutputSink: write_metrics snapshots the metrics and hands them to a writer
+    # thread, so the pipeline can move on to the next batch. At most max_pending batches wait
+    # in the queue; beyond that write_metrics blocks until the writers catch up. A writer
+    # failure is raised on the next write_metrics, flush or close. The writer thread is a
+    # daemon, so queued batches are only guaranteed to be written once close returns;
+    # DataPipeline.close closes its output sink.
+    def __init__(self, writers, max_pending=4):
+        self.writers = writers
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.batches = 0
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.drain, name="async-output-sink", daemon=True)
+        self.thread.start()
+
+    def write_metrics(self, metrics):
+        if self.closed:
+            raise RuntimeError("AsyncOutputSink is closed")
+        self.raise_if_failed()
+        self.pending.put((self.batches, list(metrics.items())))
+        self.batches += 1
+
+    def drain(self):
+        while True:
+            item = self.pending.get()
+            try:
+                if item is None:
+                    # Writers are closed on this thread, which is the one that opened their connections
+                    for writer in self.writers:
+                        writer.close()
+                    return
+                if self.error is None:
+                    batch, rows = item
+                    for writer in self.writers:
+                        writer.write_rows(batch, rows)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.pending.task_done()
+
+    def flush(self):
+        self.pending.join()
+        self.raise_if_failed()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.pending.put(None)
+            self.thread.join()
+        self.raise_if_failed()
+
+    def raise_if_failed(self):
+        if self.error is not None:
+            raise RuntimeError("Metrics writer failed") from self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
 
 class DataPipeline:
-    def __init__(self):
+    def __init__(self, fx_rates_path=None, instrumentation=None):
+        self.fx_rates_path = fx_rates_path
+        self.instrumentation = instrumentation
         self.validator = TransactionValidator()
-        self.transformer = TransactionTransformer()
+        self.transformer = TransactionTransformer(FxRateTable(fx_rates_path) if fx_rates_path else None)
         self.aggregator = MetricsAggregator()
         self.error_sink = ErrorSink()
         self.output_sink = OutputSink()
+        # Set to a MultiDimensionalAggregator to collect extra group-bys from the same run;
+        # run, run_batch and run_parallel all feed it
+        self.rollup_aggregator = None
+
+    def close(self):
+        # Waits for an asynchronous output sink to finish writing, and removes the error sink's
+        # temporary spill file, if it made one
+        try:
+            self.output_sink.close()
+        finally:
+            self.error_sink.close()
 
     def run(self, raw_records):
+        if self.instrumentation is None:
+            self.output_sink.write_metrics(self.compute_metrics(raw_records))
+            return
+
+        run_started = time.perf_counter()
+        metrics, input_records = self.compute_metrics_instrumented(raw_records)
+        self.write_output(metrics, input_records, run_started)
+
+    def write_output(self, metrics, input_records, run_started):
+        # Writes the metrics, timing the output stage and closing the run when instrumented
+        if self.instrumentation is None:
+            self.output_sink.write_metrics(metrics)
+            return
+
+        started = time.perf_counter()
+        self.output_sink.write_metrics(metrics)
+        finished = time.perf_counter()
+        self.instrumentation.add("output", finished - started, len(metrics))
+        self.instrumentation.finish_run(input_records, finished - run_started)
+
+    def compute_metrics_instrumented(self, raw_records, first_offset=0):
+        # compute_metrics with each stage timed into self.instrumentation; returns (metrics, input
+        # record count). A separate loop, so that without instrumentation compute_metrics pays
+        # nothing per record.
+        clock = time.perf_counter
+        parse_seconds = validate_seconds = normalize_seconds = 0.0
+        parsed_count = validated_count = normalized_count = 0
+        parse_errors = validate_errors = normalize_errors = 0
+
         valid_transactions = []
-        for record in raw_records:
+        today = date.today()
+        self.transformer.refresh_rates()
+        input_records = 0
+        for offset, record in enumerate(raw_records, first_offset):
+            input_records += 1
+            started = clock()
             try:
                 tx = self.parse(record.raw_line)
-                if self.validator.is_valid(tx):
-                    normalized = self.transformer.normalize_currency(tx)
+            except Exception as e:
+                parse_seconds += clock() - started
+                parse_errors += 1
+                self.error_sink.record_error(record.raw_line, str(e), offset)
+                continue
+            parsed = clock()
+            parse_seconds += parsed - started
+            parsed_count += 1
+
+            is_valid = self.validator.is_valid(tx, today)
+            validated = clock()
+            validate_seconds += validated - parsed
+            validated_count += 1
+            if not is_valid:
+                validate_errors += 1
+                self.error_sink.record_error(record.raw_line, "Validation failed", offset)
+                continue
+
+            try:
+                valid_transactions.append(self.transformer.normalize_currency_in_place(tx))
+                normalized_count += 1
+            except Exception as e:
+                normalize_errors += 1
+                self.error_sink.record_error(record.raw_line, str(e), offset)
+            normalize_seconds += clock() - validated
+
+        stats = self.instrumentation
+        stats.add("parse", parse_seconds, parsed_count, parse_errors)
+        stats.add("validate", validate_seconds, validated_count, validate_errors)
+        stats.add("normalize", normalize_seconds, normalized_count, normalize_errors)
+
+        started = clock()
+        metrics = self.aggregator.total_amount_by_region(valid_transactions)
+        if self.rollup_aggregator is not None:
+            self.rollup_aggregator.add_all(valid_transactions)
+        stats.add("aggregate", clock() - started, len(valid_transactions))
+        return metrics, input_records
+
+    def compute_metrics(self, raw_records, first_offset=0):
+        valid_transactions = []
+        today = date.today()
+        self.transformer.refresh_rates()
+        for offset, record in enumerate(raw_records, first_offset):
+            try:
+                tx = self.parse(record.raw_line)
+                if self.validator.is_valid(tx, today):
+                    normalized = self.transformer.normalize_currency_in_place(tx)
                     valid_transactions.append(normalized)
                 else:
-                    self.error_sink.record_error(record.raw_line, "Validation failed")
+                    self.error_sink.record_error(record.raw_line, "Validation failed", offset)
             except Exception as e:
-                self.error_sink.record_error(record.raw_line, str(e))
+                self.error_sink.record_error(record.raw_line, str(e), offset)
 
-        metrics = self.aggregator.total_amount_by_region(valid_transactions)
-        self.output_sink.write_metrics(metrics)
+        if self.rollup_aggregator is not None:
+            self.rollup_aggregator.add_all(valid_transactions)
+        return self.aggregator.total_amount_by_region(valid_transactions)
+
+    def run_parallel(self, raw_records, workers=None, shard_size=100000, error_dir=None):
+        # Shards the input across processes, each running its own pipeline and spilling its bad
+        # records to its own file in a private directory under error_dir (the system temp
+        # directory by default), removed when the run ends. Totals are merged in shard order and
+        # each shard's error file is appended to error_sink's spill file, so the driver never
+        # holds the bad records but error_sink reports them as after run. Shards are cut from
+        # raw_records as workers free up, so at most two per worker are held at once.
+        run_started = time.perf_counter()
+        workers = workers or os.cpu_count() or 1
+        shard_dir = tempfile.mkdtemp(prefix="pipeline_errors_", dir=error_dir)
+        records = iter(raw_records)
+        metrics = {}
+        input_records = 0
+        rollup_groupings = self.rollup_aggregator.base_groupings if self.rollup_aggregator is not None else None
+        instrumented = self.instrumentation is not None
+
+        def merge(result):
+            shard_metrics, reason_counts, sample, error_path, rollup_tables, shard_stats = result
+            merge_started = time.perf_counter()
+            for region, total in shard_metrics.items():
+                metrics[region] = metrics.get(region, 0.0) + total
+            if rollup_tables is not None:
+                self.rollup_aggregator.merge_tables(rollup_tables)
+            if instrumented:
+                self.instrumentation.merge(shard_stats)
+                self.instrumentation.add("aggregate", time.perf_counter() - merge_started)
+            self.error_sink.merge_spill(error_path, reason_counts, sample)
+            if error_path is not None:
+                os.remove(error_path)
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for shard_index in count():
+                    lines = [record.raw_line for record in islice(records, shard_size)]
+                    if not lines:
+                        break
+                    input_records += len(lines)
+                    pending.append(executor.submit(run_shard, shard_index, lines, shard_dir, shard_index * shard_size,
+                                                   self.fx_rates_path, rollup_groupings, instrumented))
+                    if len(pending) >= 2 * workers:
+                        merge(pending.popleft().result())
+                while pending:
+                    merge(pending.popleft().result())
+        finally:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+        self.write_output(metrics, input_records, run_started)
+
+    def run_batch(self, raw_records, batch_size=65536):
+        # Columnar counterpart of run. Bad rows reach the error sink in input order with the same
+        # reasons; totals match run up to float rounding, as they are summed per chunk.
+        run_started = time.perf_counter()
+        today = np.datetime64(date.today(), "D")
+        self.transformer.refresh_rates()
+        metrics = {}
+        lines_of = attrgetter("raw_line")
+        records = iter(raw_records)
+        first_offset = 0
+
+        while True:
+            lines = list(map(lines_of, islice(records, batch_size)))
+            if not lines:
+                break
+            self.process_chunk(lines, today, metrics, first_offset)
+            first_offset += len(lines)
+
+        self.write_output(metrics, first_offset, run_started)
+
+    def process_chunk(self, lines, today, metrics, first_offset=0):
+        # Stages are timed per chunk, which costs nothing measurable; bad rows are written to the
+        # error sink as part of the normalize stage
+        clock = time.perf_counter
+        started = clock()
+        batch, errors = self.parse_chunk(lines)
+        parse_errors = len(errors)
+        parsed = clock()
+
+        valid = self.validator.valid_mask(batch, today)
+        errors.extend((row, "Validation failed") for row in batch.rows[~valid].tolist())
+        validated = clock()
+
+        kept = np.flatnonzero(valid)
+        rows, regions = batch.rows[kept], batch.regions[kept]
+        amounts, failed = self.transformer.normalize_currency_columns(
+            batch.currencies[kept].tolist(), batch.amounts[kept], batch.transaction_dates[kept].tolist())
+        if failed:
+            errors.extend((int(rows[position]), reason) for position, reason in failed.items())
+            converted = np.ones(len(rows), dtype=bool)
+            converted[list(failed)] = False
+            kept, regions, amounts = kept[converted], regions[converted], amounts[converted]
+
+        for row, reason in sorted(errors):
+            self.error_sink.record_error(lines[row], reason, first_offset + row)
+        normalized = clock()
+
+        self.aggregator.total_amount_by_region_columns(regions.tolist(), amounts, metrics)
+        if self.rollup_aggregator is not None:
+            self.rollup_aggregator.add_columns(amounts, {
+                "region": regions.tolist(),
+                "day": batch.transaction_dates[kept].tolist(),
+                "customer": batch.customer_ids[kept].tolist(),
+                "currency": batch.currencies[kept].tolist()
+            })
+
+        stats = self.instrumentation
+        if stats is not None:
+            invalid = len(batch.rows) - len(rows)
+            stats.add("parse", parsed - started, len(batch.rows), parse_errors)
+            stats.add("validate", validated - parsed, len(batch.rows), invalid)
+            stats.add("normalize", normalized - validated, len(amounts), len(failed))
+            stats.add("aggregate", clock() - normalized, len(amounts))
+
+    def parse_chunk(self, lines):
+        # Returns (batch, [(row, reason)]). Rows the bulk parser leaves go through parse one at a
+        # time, so their errors carry exactly the messages run would record and any that parse
+        # accepts still reach the batch.
+        batch, leftover = self.parse_columns(lines)
+
+        errors = []
+        rows, transactions = [], []
+        for row in leftover:
+            try:
+                transactions.append(self.parse(lines[row]))
+                rows.append(row)
+            except Exception as e:
+                errors.append((row, str(e)))
+
+        if transactions:
+            parsed = TransactionBatch.from_transactions(rows, transactions)
+            columns = [np.concatenate(pair) for pair in zip(batch.columns(), parsed.columns())]
+            order = np.argsort(columns[0], kind="stable")
+            batch = TransactionBatch(*(column[order] for column in columns))
+        return batch, errors
+
+    def parse_columns(self, lines):
+        # Returns (batch, sorted rows left for parse). Lines of exactly six fields are tokenized
+        # together by the pandas C parser. Lines with another field count, or with a newline or
+        # NUL the tokenizer would split on, are left for parse, as are rows whose amount float()
+        # refuses or whose date parse_iso_date refuses. Dates are parsed once per distinct string.
+        regular = np.fromiter(map(methodcaller("count", ","), lines), dtype=np.intp, count=len(lines)) == 5
+        text = "\n".join(lines)
+        if text.count("\n") != len(lines) - 1 or "\0" in text:
+            regular &= np.fromiter(("\n" not in line and "\0" not in line for line in lines),
+                                   dtype=bool, count=len(lines))
+        rows = np.flatnonzero(regular)
+        if len(rows) < len(lines):
+            text = "\n".join([lines[row] for row in rows.tolist()])
+
+        frame = None
+        if len(rows):
+            try:
+                frame = pd.read_csv(io.StringIO(text), header=None, dtype=CHUNK_DTYPES, quoting=csv.QUOTE_NONE,
+                                    na_filter=False, lineterminator="\n")
+            except ValueError:
+                # Text the tokenizer cannot take, such as lone surrogates, falls back to parse
+                pass
+        if frame is None or len(frame) != len(rows):
+            return TransactionBatch.from_transactions([], []), list(range(len(lines)))
+
+        # Amounts are converted by float(), as in parse
+        amounts = frame[2].to_numpy(dtype=object)
+        failed = np.zeros(len(rows), dtype=bool)
+        try:
+            amount_values = amounts.astype(np.float64)
+        except ValueError:
+            # map resumes after the element that raised, so each bad amount costs one exception
+            values = []
+            converted = map(float, amounts)
+            while True:
+                try:
+                    values.extend(converted)
+                    break
+                except ValueError:
+                    failed[len(values)] = True
+                    values.append(np.nan)
+            amount_values = np.array(values, dtype=np.float64)
+
+        dates = frame[4].cat
+        day_numbers = np.zeros(len(dates.categories), dtype=np.int64)
+        bad_dates = np.zeros(len(dates.categories), dtype=bool)
+        for code, value in enumerate(dates.categories.tolist()):
+            try:
+                day_numbers[code] = parse_iso_date(value).toordinal() - EPOCH_ORDINAL
+            except ValueError:
+                bad_dates[code] = True
+        date_codes = dates.codes.to_numpy()
+        failed |= bad_dates[date_codes]
+
+        batch = TransactionBatch(
+            rows,
+            frame[0].to_numpy(dtype=object),
+            frame[1].to_numpy(dtype=object),
+            amount_values,
+            category_values(frame[3]),
+            day_numbers[date_codes].view("datetime64[D]"),
+            category_values(frame[5])
+        )
+
+        leftover = np.flatnonzero(~regular)
+        if failed.any():
+            kept = ~failed
+            leftover = np.union1d(leftover, rows[failed])
+            batch = TransactionBatch(*(column[kept] for column in batch.columns()))
+        return batch, leftover.tolist()
 
     def parse(self, line):
         parts = line.split(",")
@@ -128,11 +1050,38 @@ class DataPipeline:
             parts[1],
             float(parts[2]),
             parts[3],
-            datetime.strptime(parts[4], "%Y-%m-%d").date(),
+            parse_iso_date(parts[4]),
             parts[5]
         )
 
 
+def category_values(column):
+    # Expands a categorical column to an object array of its strings
+    return column.cat.categories.to_numpy(dtype=object)[column.cat.codes.to_numpy()]
+
+
+def run_shard(shard_index, raw_lines, error_dir, first_offset, fx_rates_path=None, rollup_groupings=None,
+              instrumented=False):
+    # Worker entry point for DataPipeline.run_parallel
+    error_path = os.path.join(error_dir, f"errors-{shard_index:05d}.csv.gz")
+    pipeline = DataPipeline(fx_rates_path, PipelineInstrumentation() if instrumented else None)
+    pipeline.error_sink = ErrorSink(error_path)
+    if rollup_groupings is not None:
+        pipeline.rollup_aggregator = MultiDimensionalAggregator(rollup_groupings)
+    records = (RawRecord(line) for line in raw_lines)
+    try:
+        if instrumented:
+            metrics, _ = pipeline.compute_metrics_instrumented(records, first_offset)
+        else:
+            metrics = pipeline.compute_metrics(records, first_offset)
+    finally:
+        pipeline.error_sink.close()
+    rollup_tables = pipeline.rollup_aggregator.tables if rollup_groupings is not None else None
+    sink = pipeline.error_sink
+    return (metrics, sink.reason_counts, sink.sample, error_path if os.path.exists(error_path) else None,
+            rollup_tables, pipeline.instrumentation)
+
+
 if __name__ == "__main__":
     input_records = [
         RawRecord("TXN1,CUST1,1000,USD,2024-01-10,US"),
@@ -143,3 +1092,4 @@ if __name__ == "__main__":
 
     pipeline = DataPipeline()
     pipeline.run(input_records)
+    pipeline.close()
@@ -1,10 +1,26 @@
 import sys
+
+import numpy as np
+import pandas as pd
+from pyspark import StorageLevel
 from pyspark.sql import SparkSession
 from pyspark.sql.types import StructType, StructField, StringType, IntegerType, DoubleType, TimestampType
-from pyspark.sql.functions import col, lit, to_timestamp, when
+from pyspark.sql.functions import broadcast, col, lit, pandas_udf, to_date, to_timestamp, when
 from pyspark.sql.utils import AnalysisException
 
 class UserMetricsJob:
+    EVENT_COLUMNS = ["user_id", "event_type", "score", "amount", "ts"]
+    JOB_EVENT_TYPES = ["click", "purchase"]
+    BROADCAST_USERS_MAX_BYTES = 64 * 1024 * 1024
+    # (lower bound, label): a score gets the label of the highest bound it reaches.
+    # Null scores and scores below every bound are "unknown".
+    SCORE_BUCKETS = [(80, "high"), (50, "medium"), (0, "low")]
+    OUTPUT_PARTITION_COLUMNS = ["event_date", "country"]
+    TARGET_FILE_BYTES = 128 * 1024 * 1024
+    # Rough compressed Parquet size of one output row, used to turn a target file size into rows
+    OUTPUT_BYTES_PER_ROW = 40
+    # Table property holding the version of the users CSV a bucketed users table was built from
+    USERS_VERSION_PROPERTY = "users_source_version"
 
     @staticmethod
     def get_arg(args, key, default):
@@ -22,6 +38,21 @@ class UserMetricsJob:
         min_date    = UserMetricsJob.get_arg(args, "--from",   "1970-01-01")
         max_date    = UserMetricsJob.get_arg(args, "--to",     "2100-01-01")
         use_udf     = UserMetricsJob.get_arg(args, "--useUdf", "false").lower() == "true"
+        # "parquet" reads --events as the date-partitioned dataset written by convert_events_to_parquet
+        events_format = UserMetricsJob.get_arg(args, "--eventsFormat", "csv")
+        convert_to    = UserMetricsJob.get_arg(args, "--convertEventsTo", None)
+        # Users files up to this size are broadcast; larger ones go through a sort-merge join
+        broadcast_max = int(UserMetricsJob.get_arg(args, "--broadcastUsersMaxBytes", str(UserMetricsJob.BROADCAST_USERS_MAX_BYTES)))
+        # When set, users are read from this bucketed table, rebuilt whenever --users changes
+        users_table   = UserMetricsJob.get_arg(args, "--usersTable", None)
+        users_buckets = int(UserMetricsJob.get_arg(args, "--usersBuckets", "8"))
+        refresh_users = UserMetricsJob.get_arg(args, "--refreshUsersTable", "false").lower() == "true"
+        # e.g. "80:high,50:medium,0:low"
+        score_buckets = UserMetricsJob.parse_score_buckets(UserMetricsJob.get_arg(args, "--scoreBuckets", None))
+        # overwrite | append | overwritePartitions (replace only the date/country partitions in this run)
+        write_mode    = UserMetricsJob.get_arg(args, "--writeMode", "overwrite")
+        target_bytes  = int(UserMetricsJob.get_arg(args, "--targetFileBytes", str(UserMetricsJob.TARGET_FILE_BYTES)))
+        bytes_per_row = int(UserMetricsJob.get_arg(args, "--outputBytesPerRow", str(UserMetricsJob.OUTPUT_BYTES_PER_ROW)))
 
         spark = SparkSession.builder \
             .appName("UserMetricsJob") \
@@ -32,19 +63,32 @@ class UserMetricsJob:
         try:
             # Logging omitted as per anti-hallucination rules
 
-            events = UserMetricsJob.load_events(spark, events_path)
-            users  = UserMetricsJob.load_users(spark, users_path)
+            if convert_to is not None:
+                UserMetricsJob.convert_events_to_parquet(spark, events_path, convert_to)
+                events_path, events_format = convert_to, "parquet"
 
-            transformed = UserMetricsJob.transform(events, users, min_date, max_date, use_udf)
+            if events_format == "parquet":
+                events = UserMetricsJob.load_events_parquet(spark, events_path, min_date, max_date)
+            else:
+                events = UserMetricsJob.load_events(spark, events_path)
+            if users_table is not None:
+                users = UserMetricsJob.load_bucketed_users(spark, users_path, users_table, users_buckets, refresh_users)
+                users_size = UserMetricsJob.table_size_bytes(spark, users_table)
+            else:
+                users = UserMetricsJob.load_users(spark, users_path)
+                users_size = UserMetricsJob.path_size_bytes(spark, users_path)
 
-            transformed \
-                .coalesce(1) \
-                .write \
-                .mode("overwrite") \
-                .format("parquet") \
-                .save(out_path)
+            transformed = UserMetricsJob.transform(events, users, min_date, max_date, use_udf,
+                                                   users_size_bytes=users_size, broadcast_max_bytes=broadcast_max,
+                                                   score_buckets=score_buckets)
+
+            # Cached so the preview below reads the computed rows instead of rerunning the lineage
+            transformed = transformed.persist(StorageLevel.MEMORY_AND_DISK)
+
+            UserMetricsJob.write_output(transformed, out_path, write_mode, target_bytes, bytes_per_row)
 
             transformed.show(truncate=False)
+            transformed.unpersist()
 
             # Logging omitted as per anti-hallucination rules
         except AnalysisException as ae:
@@ -71,6 +115,35 @@ class UserMetricsJob:
             .schema(schema) \
             .csv(path)
 
+    @staticmethod
+    def convert_events_to_parquet(spark, csv_path, parquet_path):
+        # Rewrites the events CSV as Parquet partitioned by event_date and event_type, so the
+        # job's date window and event-type filter can skip whole directories
+        UserMetricsJob.load_events(spark, csv_path) \
+            .withColumn("event_date", to_date(col("ts"))) \
+            .repartition("event_date", "event_type") \
+            .write \
+            .mode("overwrite") \
+            .partitionBy("event_date", "event_type") \
+            .parquet(parquet_path)
+
+    @staticmethod
+    def load_events_parquet(spark, path, min_date_inclusive, max_date_exclusive, event_types=None):
+        # The event_type and event_date filters prune partitions, the ts filter is pushed down to
+        # the Parquet reader, and the select keeps the scan to the job's columns.
+        # transform still applies the exact ts window.
+        if event_types is None:
+            event_types = UserMetricsJob.JOB_EVENT_TYPES
+
+        return spark.read \
+            .parquet(path) \
+            .filter(col("event_type").isin(event_types)) \
+            .filter(col("event_date") >= to_date(to_timestamp(lit(min_date_inclusive)))) \
+            .filter(col("event_date") <= to_date(to_timestamp(lit(max_date_exclusive)))) \
+            .filter(col("ts") >= to_timestamp(lit(min_date_inclusive))) \
+            .filter(col("ts") < to_timestamp(lit(max_date_exclusive))) \
+            .select(*UserMetricsJob.EVENT_COLUMNS)
+
     @staticmethod
     def load_users(spark, path):
         schema = StructType([
@@ -84,7 +157,73 @@ class UserMetricsJob:
             .csv(path)
 
     @staticmethod
-    def transform(events, users, min_date_inclusive, max_date_exclusive, use_udf_bucket):
+    def load_bucketed_users(spark, path, table, buckets, refresh=False):
+        # Users bucketed and sorted by user_id, so a sort-merge join against them does not shuffle
+        # the dimension again. The table records the version of the CSV it was built from and is
+        # rebuilt when the CSV changes or refresh is set; reuse across separate runs needs a
+        # persistent catalog such as a Hive metastore.
+        version = UserMetricsJob.path_version(spark, path)
+        if refresh or UserMetricsJob.users_table_version(spark, table) != version:
+            UserMetricsJob.load_users(spark, path) \
+                .write \
+                .bucketBy(buckets, "user_id") \
+                .sortBy("user_id") \
+                .mode("overwrite") \
+                .format("parquet") \
+                .saveAsTable(table)
+            spark.sql(f"ALTER TABLE {table} SET TBLPROPERTIES ('{UserMetricsJob.USERS_VERSION_PROPERTY}' = '{version}')")
+        return spark.table(table)
+
+    @staticmethod
+    def users_table_version(spark, table):
+        if not spark.catalog.tableExists(table):
+            return None
+        properties = {row.key: row.value for row in spark.sql(f"SHOW TBLPROPERTIES {table}").collect()}
+        return properties.get(UserMetricsJob.USERS_VERSION_PROPERTY)
+
+    @staticmethod
+    def path_version(spark, path):
+        # File count, total length and latest modification time of the files under path; any
+        # file added, removed or rewritten changes it
+        hadoop_path = spark._jvm.org.apache.hadoop.fs.Path(path)
+        fs = hadoop_path.getFileSystem(spark._jsc.hadoopConfiguration())
+        files = fs.listFiles(hadoop_path, True)
+        count = length = latest = 0
+        while files.hasNext():
+            status = files.next()
+            count += 1
+            length += status.getLen()
+            latest = max(latest, status.getModificationTime())
+        return f"{count}:{length}:{latest}"
+
+    @staticmethod
+    def path_size_bytes(spark, path):
+        # Total size of the files under path, through the Hadoop FileSystem so any supported URI works
+        hadoop_path = spark._jvm.org.apache.hadoop.fs.Path(path)
+        fs = hadoop_path.getFileSystem(spark._jsc.hadoopConfiguration())
+        return fs.getContentSummary(hadoop_path).getLength()
+
+    @staticmethod
+    def table_size_bytes(spark, table):
+        # Size of a catalog table's files, found through its location
+        details = spark.sql(f"DESCRIBE TABLE EXTENDED {table}").collect()
+        location = next(row.data_type for row in details if row.col_name == "Location")
+        return UserMetricsJob.path_size_bytes(spark, location)
+
+    @staticmethod
+    def join_users(events, users, users_size_bytes=None, broadcast_max_bytes=BROADCAST_USERS_MAX_BYTES):
+        # Enriches events with country. A users table known to fit under broadcast_max_bytes is
+        # broadcast; a larger one is forced into a sort-merge join. With no size, Spark decides.
+        users = users.select("user_id", "country")
+        if users_size_bytes is None:
+            return events.join(users, on="user_id", how="left")
+        if users_size_bytes <= broadcast_max_bytes:
+            return events.join(broadcast(users), on="user_id", how="left")
+        return events.join(users.hint("merge"), on="user_id", how="left")
+
+    @staticmethod
+    def transform(events, users, min_date_inclusive, max_date_exclusive, use_udf_bucket,
+                  users_size_bytes=None, broadcast_max_bytes=BROADCAST_USERS_MAX_BYTES, score_buckets=None):
         in_window = (
             col("ts") >= to_timestamp(lit(min_date_inclusive))
         ) & (
@@ -92,26 +231,92 @@ class UserMetricsJob:
         )
 
         filtered = events \
-            .filter(col("event_type").isin(["click", "purchase"])) \
+            .filter(col("event_type").isin(UserMetricsJob.JOB_EVENT_TYPES)) \
             .filter(in_window)
 
+        filtered = UserMetricsJob.join_users(filtered, users, users_size_bytes, broadcast_max_bytes)
+
+        if score_buckets is None:
+            score_buckets = UserMetricsJob.SCORE_BUCKETS
+
         if use_udf_bucket:
-            # Placeholder for sparkRegisterBucketUdf: actual implementation not visible in Java code
-            filtered = filtered.withColumn("score_bucket", UserMetricsJob.call_udf_bucket_score(filtered.sparkSession, col("score")))
+            filtered = filtered.withColumn("score_bucket", UserMetricsJob.call_udf_bucket_score(filtered.sparkSession, col("score"), score_buckets))
         else:
-            filtered = filtered.withColumn(
-                "score_bucket",
-                when(col("score").isNull(), lit("unknown"))
-                .when(col("score") >= lit(80), lit("high"))
-                # The rest of the logic is not present in the provided Java code snippet
-            )
+            filtered = filtered.withColumn("score_bucket", UserMetricsJob.score_bucket_expr(col("score"), score_buckets))
         return filtered
 
     @staticmethod
-    def call_udf_bucket_score(spark_session, score_col):
-        # Placeholder for callUDF("bucketScore", col("score"))
-        # Actual UDF registration and usage not shown in Java code
-        return score_col
+    def write_output(transformed, out_path, write_mode="overwrite", target_file_bytes=TARGET_FILE_BYTES,
+                     bytes_per_row=OUTPUT_BYTES_PER_ROW):
+        # Writes Parquet partitioned by event_date and country. Repartitioning on those columns lets
+        # each partition directory be written by one task, in parallel across partitions, and
+        # maxRecordsPerFile splits large ones into files of roughly target_file_bytes.
+        spark = transformed.sparkSession
+        rows_per_file = max(target_file_bytes // bytes_per_row, 1)
+
+        if write_mode == "overwritePartitions":
+            spark.conf.set("spark.sql.sources.partitionOverwriteMode", "dynamic")
+            mode = "overwrite"
+        elif write_mode in ("overwrite", "append"):
+            spark.conf.set("spark.sql.sources.partitionOverwriteMode", "static")
+            mode = write_mode
+        else:
+            raise ValueError(f"Unknown write mode {write_mode}")
+
+        transformed \
+            .withColumn("event_date", to_date(col("ts"))) \
+            .repartition(*UserMetricsJob.OUTPUT_PARTITION_COLUMNS) \
+            .write \
+            .mode(mode) \
+            .partitionBy(*UserMetricsJob.OUTPUT_PARTITION_COLUMNS) \
+            .option("maxRecordsPerFile", rows_per_file) \
+            .format("parquet") \
+            .save(out_path)
+
+    @staticmethod
+    def parse_score_buckets(spec):
+        if spec is None:
+            return None
+        buckets = []
+        for entry in spec.split(","):
+            bound, label = entry.split(":", 1)
+            buckets.append((float(bound), label))
+        return buckets
+
+    @staticmethod
+    def score_bucket_expr(score_col, score_buckets):
+        # Compiles the bucket table into a native CASE WHEN, evaluated inside the JVM
+        expr = when(score_col.isNull(), lit("unknown"))
+        for bound, label in sorted(score_buckets, reverse=True):
+            expr = expr.when(score_col >= lit(bound), lit(label))
+        return expr.otherwise(lit("unknown"))
+
+    @staticmethod
+    def score_bucket_pandas_udf(score_buckets, bucket_fn=None):
+        # Vectorized fallback for logic a CASE WHEN cannot express: rows cross to Python in Arrow
+        # batches. bucket_fn, if given, maps a pandas Series of scores to a Series of labels;
+        # otherwise the bucket table is applied with searchsorted.
+        ordered = sorted(score_buckets)
+        bounds = np.array([bound for bound, _ in ordered], dtype=np.float64)
+        labels = np.array(["unknown"] + [label for _, label in ordered], dtype=object)
+
+        @pandas_udf(StringType())
+        def bucket_score(scores: pd.Series) -> pd.Series:
+            if bucket_fn is not None:
+                return bucket_fn(scores)
+            values = scores.to_numpy(dtype=np.float64, na_value=np.nan)
+            result = labels[np.searchsorted(bounds, values, side="right")]
+            result[np.isnan(values)] = "unknown"
+            return pd.Series(result)
+
+        return bucket_score
+
+    @staticmethod
+    def call_udf_bucket_score(spark_session, score_col, score_buckets=None, bucket_fn=None):
+        # Stands in for the Java callUDF("bucketScore", col("score")), using the pandas UDF
+        if score_buckets is None:
+            score_buckets = UserMetricsJob.SCORE_BUCKETS
+        return UserMetricsJob.score_bucket_pandas_udf(score_buckets, bucket_fn)(score_col)
 
 if __name__ == "__main__":
     UserMetricsJob.main(sys.argv[1:])
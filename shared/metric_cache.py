@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class _Shard:
+    __slots__ = ("lock", "entries", "capacity", "hits", "misses", "evictions", "expirations")
+
+    def __init__(self, capacity):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+class ShardedLRUCache:
+    # LRU cache split into independently locked shards, so threads touching different keys
+    # rarely wait on each other. Reads and writes both refresh recency, like a Java
+    # LinkedHashMap with accessOrder=true. Each shard owns an equal slice of the capacity and
+    # evicts its own least recently used entry, so no operation touches more than one shard.
+    # Recency is therefore only approximately global: a shard that receives more than its share
+    # of live keys evicts while others still have room, and the cache can hold slightly fewer
+    # than capacity entries. Keys spread by hash keep that gap small; shards=1 is an exact LRU.
+    # With ttl_seconds set, entries older than that are treated as missing.
+
+    def __init__(self, capacity=5000, shards=16, ttl_seconds=None, clock=time.monotonic):
+        if capacity < 1 or shards < 1:
+            raise ValueError("capacity and shards must be at least 1")
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        shards = min(shards, capacity)
+        self.shards = [_Shard(capacity // shards + (index < capacity % shards)) for index in range(shards)]
+        self.shard_count = shards
+
+    def _shard(self, key):
+        return self.shards[hash(key) % self.shard_count]
+
+    def get(self, key, default=None):
+        # get and __setitem__ pick the shard inline; they are the hot path
+        shard = self.shards[hash(key) % self.shard_count]
+        with shard.lock:
+            entry = shard.entries.get(key, _MISSING)
+            if entry is _MISSING:
+                shard.misses += 1
+                return default
+            if entry[1] is not None and entry[1] <= self.clock():
+                del shard.entries[key]
+                shard.expirations += 1
+                shard.misses += 1
+                return default
+            shard.entries.move_to_end(key)
+            shard.hits += 1
+            return entry[0]
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        expires_at = None if self.ttl_seconds is None else self.clock() + self.ttl_seconds
+        shard = self.shards[hash(key) % self.shard_count]
+        with shard.lock:
+            entries = shard.entries
+            entries[key] = (value, expires_at)
+            entries.move_to_end(key)
+            if len(entries) > shard.capacity:
+                entries.popitem(last=False)
+                shard.evictions += 1
+
+    def __delitem__(self, key):
+        shard = self._shard(key)
+        with shard.lock:
+            del shard.entries[key]
+
+    def __contains__(self, key):
+        # Does not count as a use and does not refresh recency
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key, _MISSING)
+            return entry is not _MISSING and (entry[1] is None or entry[1] > self.clock())
+
+    def __len__(self):
+        return sum(len(shard.entries) for shard in self.shards)
+
+    def clear(self):
+        for shard in self.shards:
+            with shard.lock:
+                shard.entries.clear()
+
+    def stats(self):
+        totals = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "size": 0}
+        for shard in self.shards:
+            with shard.lock:
+                totals["hits"] += shard.hits
+                totals["misses"] += shard.misses
+                totals["evictions"] += shard.evictions
+                totals["expirations"] += shard.expirations
+                totals["size"] += len(shard.entries)
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_rate"] = totals["hits"] / lookups if lookups else 0.0
+        return totals
@@ -0,0 +1,278 @@
+import atexit
+import io
+import queue
+import random
+import sqlite3
+import threading
+import time
+
+def postgres_connector(**connect_kwargs):
+    def connect():
+        import psycopg2
+        conn = psycopg2.connect(**connect_kwargs)
+        conn.autocommit = False
+        return conn
+    return connect
+
+def sqlite_connector(path):
+    # Stand-in for Postgres in local runs; pooled connections are handed between threads
+    def connect():
+        return sqlite3.connect(path, check_same_thread=False)
+    return connect
+
+class ConnectionPool:
+    # Connections are opened on demand up to max_size and reused; acquire blocks while all are in use
+
+    def __init__(self, connect, max_size=4):
+        self.connect = connect
+        self.max_size = max_size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_size)
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            conn = self.connect()
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.opened += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        # A connection that failed mid-write is closed rather than handed to the next writer
+        if discard:
+            with self.lock:
+                self.opened -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+        else:
+            self.idle.put(conn)
+        self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.opened -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(name, connect, max_size=4):
+    # One pool per name per process, so every task a Spark Python worker runs shares its connections
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = ConnectionPool(connect, max_size)
+        return pool
+
+@atexit.register
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+class PgSink:
+    # Bulk loader for one table. method is "copy" (COPY FROM STDIN, Postgres), "values"
+    # (multi-row INSERT through psycopg2.extras.execute_values) or "executemany" (any DB-API
+    # driver, e.g. the SQLite stand-in with placeholder "?"). Each batch is its own transaction
+    # and is retried with exponential backoff on a fresh connection.
+
+    METHODS = ("copy", "values", "executemany")
+    # COPY reads this unquoted field as NULL. Every other value except a number is written
+    # quoted, so an empty string stays an empty string and a literal "\N" stays a string.
+    COPY_NULL = "\\N"
+
+    def __init__(self, pool, table, columns, method="copy", batch_size=5000, max_retries=3,
+                 backoff_seconds=0.5, placeholder="%s"):
+        if method not in PgSink.METHODS:
+            raise ValueError(f"Unknown load method {method}")
+        self.pool = pool
+        self.table = table
+        self.columns = tuple(columns)
+        self.method = method
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.placeholder = placeholder
+        # Several BoundedWriteQueue workers can share one sink
+        self.lock = threading.Lock()
+        self.rows_written = 0
+        self.retries = 0
+
+    def write(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(tuple(row))
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+
+    def write_batch(self, rows):
+        attempt = 0
+        while True:
+            conn = None
+            try:
+                conn = self.pool.acquire()
+                cur = conn.cursor()
+                try:
+                    self.load(cur, rows)
+                finally:
+                    cur.close()
+                conn.commit()
+            except Exception:
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                    self.pool.release(conn, discard=True)
+                if attempt >= self.max_retries:
+                    raise
+                # Full jitter keeps executors that failed together from retrying together
+                time.sleep(random.uniform(0, self.backoff_seconds * (2 ** attempt)))
+                attempt += 1
+                with self.lock:
+                    self.retries += 1
+            else:
+                self.pool.release(conn)
+                with self.lock:
+                    self.rows_written += len(rows)
+                return
+
+    def load(self, cur, rows):
+        column_list = ",".join(self.columns)
+
+        if self.method == "copy":
+            buffer = io.StringIO("".join([",".join(map(PgSink.copy_field, row)) + "\n" for row in rows]))
+            cur.copy_expert(f"COPY {self.table} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{PgSink.COPY_NULL}')", buffer)
+        elif self.method == "values":
+            from psycopg2.extras import execute_values
+            execute_values(cur, f"INSERT INTO {self.table} ({column_list}) VALUES %s", rows, page_size=len(rows))
+        else:
+            placeholders = ",".join([self.placeholder] * len(self.columns))
+            cur.executemany(f"INSERT INTO {self.table} ({column_list}) VALUES ({placeholders})", rows)
+
+    @staticmethod
+    def copy_field(value):
+        if value is None:
+            return PgSink.COPY_NULL
+        if isinstance(value, (int, float)):
+            return str(value)
+        return '"' + str(value).replace('"', '""') + '"'
+
+class BoundedWriteQueue:
+    # Runs write(batch) on worker threads. At most max_pending batches wait in the queue and
+    # submit blocks while it is full, so a slow database slows the producer instead of piling
+    # batches up in memory. The first failure is re-raised by the next submit, join or close.
+
+    def __init__(self, write, workers=4, max_pending=8):
+        self.write = write
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.lock = threading.Lock()
+        self.error = None
+        self.batches_written = 0
+        self.rows_written = 0
+        self.max_queue_depth = 0
+        self.queue_wait_seconds = 0.0
+        self.write_seconds = 0.0
+        self.max_write_seconds = 0.0
+        self.threads = [threading.Thread(target=self.drain, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def drain(self):
+        while True:
+            item = self.pending.get()
+            try:
+                if item is None:
+                    return
+                batch, submitted = item
+                if self.error is not None:
+                    continue
+                started = time.perf_counter()
+                try:
+                    self.write(batch)
+                except Exception as e:
+                    with self.lock:
+                        if self.error is None:
+                            self.error = e
+                    continue
+                finished = time.perf_counter()
+                with self.lock:
+                    self.batches_written += 1
+                    self.rows_written += len(batch)
+                    self.queue_wait_seconds += started - submitted
+                    self.write_seconds += finished - started
+                    self.max_write_seconds = max(self.max_write_seconds, finished - started)
+            finally:
+                self.pending.task_done()
+
+    def raise_if_failed(self):
+        if self.error is not None:
+            raise RuntimeError("Batch write failed") from self.error
+
+    def submit(self, batch):
+        self.raise_if_failed()
+        self.pending.put((batch, time.perf_counter()))
+        depth = self.pending.qsize()
+        with self.lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def join(self):
+        # Waits until every submitted batch has been written or skipped after a failure
+        self.pending.join()
+        self.raise_if_failed()
+
+    def close(self):
+        for _ in self.threads:
+            self.pending.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.raise_if_failed()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Already failing: stop the workers without masking the original error
+            try:
+                self.close()
+            except Exception:
+                pass
+
+    def metrics(self):
+        with self.lock:
+            batches = self.batches_written
+            return {
+                "batches_written": batches,
+                "rows_written": self.rows_written,
+                "queue_depth": self.pending.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "mean_queue_wait_seconds": self.queue_wait_seconds / batches if batches else 0.0,
+                "mean_write_seconds": self.write_seconds / batches if batches else 0.0,
+                "max_write_seconds": self.max_write_seconds
+            }